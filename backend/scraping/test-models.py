@@ -5,12 +5,30 @@ Tests Qwen, Llama, and GPT-OSS models for privacy analysis
 """
 
 import json
-import subprocess
+import os
+import sqlite3
+import hashlib
 import time
 import logging
+from collections import defaultdict, deque
 from datetime import datetime
-from typing import Dict, List, Tuple
-import statistics
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    orjson = None
+    json_loads = json.loads
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
 
 # Configure logging
 logging.basicConfig(
@@ -19,41 +37,278 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+RESPONSE_CACHE_PATH = os.path.join(".cache", "model_responses.sqlite")
+
+# How long ollama keeps a model resident in memory between requests
+MODEL_KEEP_ALIVE = "1h"
+
+# Privacy patterns looked for in every response (matched case-insensitively)
+COMMON_PATTERNS = (
+    "data sharing", "third parties", "arbitration", "data collection",
+    "tracking", "cookies", "permissions", "liability", "termination",
+    "content license", "privacy", "security"
+)
+
+# Score sentinels checked in ascending order: (score, "<i>/100", "score: <i>")
+SCORE_MARKERS = tuple((i, f"{i}/100", f"score: {i}") for i in range(0, 101))
+
+# Letter grades with the two spellings accepted for each
+GRADES = ('A', 'B', 'C', 'D', 'F')
+GRADE_MARKERS = tuple((grade, f"grade: {grade}", f"Grade: {grade}") for grade in GRADES)
+
+# Responses longer than this many characters are scanned with the compiled matcher
+COMPILED_SCAN_THRESHOLD = 4096
+
+
+def build_pattern_automaton(patterns: Tuple[str, ...]) -> Tuple[np.ndarray, np.ndarray]:
+    """Build an Aho-Corasick DFA over bytes.
+    
+    Returns a (states x 256) transition table and, per state, a bitmask of
+    the patterns (by index) that end in that state.
+    """
+    goto = [{}]
+    outputs = [0]
+    for bit, pattern in enumerate(patterns):
+        state = 0
+        for byte in pattern.encode():
+            if byte not in goto[state]:
+                goto[state][byte] = len(goto)
+                goto.append({})
+                outputs.append(0)
+            state = goto[state][byte]
+        outputs[state] |= 1 << bit
+    
+    transitions = np.zeros((len(goto), 256), dtype=np.int32)
+    fail = [0] * len(goto)
+    queue = deque()
+    for byte, nxt in goto[0].items():
+        transitions[0, byte] = nxt
+        queue.append(nxt)
+    
+    # Breadth-first so every fail target's row is complete before it is copied
+    while queue:
+        state = queue.popleft()
+        outputs[state] |= outputs[fail[state]]
+        for byte in range(256):
+            nxt = goto[state].get(byte)
+            if nxt is None:
+                transitions[state, byte] = transitions[fail[state], byte]
+            else:
+                fail[nxt] = transitions[fail[state], byte]
+                transitions[state, byte] = nxt
+                queue.append(nxt)
+    
+    return transitions, np.asarray(outputs, dtype=np.int64)
+
+
+if NUMBA_AVAILABLE:
+    # Score markers share the automaton with the privacy patterns
+    SCORE_SUFFIX_BIT = len(COMMON_PATTERNS)
+    SCORE_PREFIX_BIT = len(COMMON_PATTERNS) + 1
+    PATTERN_TRANSITIONS, PATTERN_OUTPUTS = build_pattern_automaton(
+        COMMON_PATTERNS + ("/100", "score: ")
+    )
+    
+    @njit(cache=True, nogil=True)
+    def scan_response(buf, transitions, outputs, suffix_bit, prefix_bit):
+        """Single pass over a lowercased UTF-8 response.
+        
+        Returns (pattern bitmask, score) where score is the smallest i in
+        0..100 such that "i/100" or "score: i" occurs, or -1 if none does.
+        """
+        n = buf.shape[0]
+        state = 0
+        mask = 0
+        score = 101
+        for j in range(n):
+            state = transitions[state, buf[j]]
+            hit = outputs[state]
+            if hit == 0:
+                continue
+            mask |= hit
+            if (hit >> suffix_bit) & 1:
+                # "/100" ends at j, so the number ends at j - 4
+                k = j - 4
+                if k >= 0 and 48 <= buf[k] <= 57:
+                    score = min(score, buf[k] - 48)
+                    if k >= 1 and 49 <= buf[k - 1] <= 57:
+                        score = min(score, (buf[k - 1] - 48) * 10 + buf[k] - 48)
+                    if k >= 2 and buf[k - 2] == 49 and buf[k - 1] == 48 and buf[k] == 48:
+                        score = min(score, 100)
+            if (hit >> prefix_bit) & 1:
+                # "score: " ends at j, so the number starts at j + 1
+                k = j + 1
+                if k < n and 48 <= buf[k] <= 57:
+                    score = min(score, buf[k] - 48)
+                    if k + 1 < n and buf[k] != 48 and 48 <= buf[k + 1] <= 57:
+                        score = min(score, (buf[k] - 48) * 10 + buf[k + 1] - 48)
+                    if k + 2 < n and buf[k] == 49 and buf[k + 1] == 48 and buf[k + 2] == 48:
+                        score = min(score, 100)
+        if score == 101:
+            score = -1
+        return mask, score
+
 class ModelTester:
     """Test and compare different fine-tuned models"""
     
-    def __init__(self):
+    def __init__(self, use_cache: bool = False, cache_path: str = RESPONSE_CACHE_PATH):
         self.models = [
             "fine-print-privacy-qwen",
             "fine-print-llama"
         ]
         self.results = {}
+        self.ollama_url = "http://localhost:11434"
+        # Reuse keep-alive connections to ollama across all tests and models
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+        self.cache = self._open_cache(cache_path) if use_cache else None
+        # Model name -> digest reported by /api/tags. Cached responses are
+        # keyed by digest, so a model rebuilt under the same tag misses.
+        self.model_digests: Dict[str, str] = {}
+    
+    def _open_cache(self, cache_path: str) -> sqlite3.Connection:
+        """Open (or create) the on-disk response cache"""
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(cache_path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, response TEXT, elapsed REAL)"
+        )
+        return conn
+    
+    def _cache_key(self, model_name: str, prompt: str) -> Optional[str]:
+        """Key a response by model digest and prompt content; None if the
+        model's digest is unknown, so its responses are never cached"""
+        digest = self.model_digests.get(model_name)
+        if digest is None:
+            return None
+        return hashlib.blake2b(f"{model_name}\0{digest}\0{prompt}".encode(), digest_size=16).hexdigest()
+    
+    def get_cached_response(self, model_name: str, prompt: str) -> Optional[Tuple[str, float]]:
+        """Return a previously recorded (response, elapsed) pair, if any"""
+        key = self._cache_key(model_name, prompt)
+        if self.cache is None or key is None:
+            return None
+        row = self.cache.execute(
+            "SELECT response, elapsed FROM responses WHERE key = ?",
+            (key,)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+    
+    def store_cached_response(self, model_name: str, prompt: str, response: str, elapsed: float):
+        """Record a successful model response for later runs"""
+        key = self._cache_key(model_name, prompt)
+        if self.cache is None or key is None:
+            return
+        with self.cache:
+            self.cache.execute(
+                "INSERT OR REPLACE INTO responses (key, response, elapsed) VALUES (?, ?, ?)",
+                (key, response, elapsed)
+            )
+    
+    def generate(self, model_name: str, prompt: str, timeout: int) -> Tuple[bool, str, float]:
+        """Run a prompt through a model, returning (success, output, elapsed).
+        
+        On failure the output is the error text reported by ollama. Raises
+        requests.Timeout once generation runs past timeout seconds.
+        """
+        # A (model, prompt) pair comes up once per run, so only the on-disk
+        # cache can save a generation
+        cached = self.get_cached_response(model_name, prompt)
+        if cached is not None:
+            return True, cached[0], cached[1]
+        
+        start_time = time.perf_counter()
+        # The request timeout only bounds each socket read, so a model that
+        # keeps streaming tokens is cut off against a wall-clock deadline
+        deadline = time.monotonic() + timeout
+        chunks = []
+        with self.session.post(
+            f"{self.ollama_url}/api/generate",
+            json={
+                "model": model_name,
+                "prompt": prompt,
+                "stream": True,
+                "keep_alive": MODEL_KEEP_ALIVE
+            },
+            timeout=timeout,
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                return False, response.text, time.perf_counter() - start_time
+            
+            for line in response.iter_lines():
+                if time.monotonic() > deadline:
+                    # Leaving the with block closes the stream
+                    raise requests.Timeout(f"{model_name} exceeded {timeout} seconds")
+                if not line:
+                    continue  # keep-alive blank lines
+                chunk = json_loads(line)
+                if 'error' in chunk:
+                    return False, chunk['error'], time.perf_counter() - start_time
+                chunks.append(chunk.get('response', ''))
+        elapsed = time.perf_counter() - start_time
+        
+        output = ''.join(chunks)
+        self.store_cached_response(model_name, prompt, output, elapsed)
+        return True, output, elapsed
+    
+    def set_keep_alive(self, model_name: str, keep_alive):
+        """Load (or with keep_alive=0, unload) a model without generating"""
+        try:
+            self.session.post(
+                f"{self.ollama_url}/api/generate",
+                json={"model": model_name, "prompt": "", "keep_alive": keep_alive},
+                timeout=300
+            )
+        except requests.RequestException as e:
+            logger.warning(f"Could not set keep_alive for {model_name}: {e}")
+    
+    def preload_models(self, models: List[str]):
+        """Pin models in memory so test calls don't pay the load cost"""
+        for model in models:
+            logger.info(f"Preloading {model}...")
+            self.set_keep_alive(model, MODEL_KEEP_ALIVE)
+    
+    def release_models(self, models: List[str]):
+        """Release model memory once testing is finished"""
+        for model in models:
+            self.set_keep_alive(model, 0)
         
     def check_available_models(self):
         """Check which models are actually available"""
         logger.info("Checking available models...")
         
-        result = subprocess.run(
-            ['ollama', 'list'],
-            capture_output=True,
-            text=True
-        )
+        try:
+            response = self.session.get(f"{self.ollama_url}/api/tags", timeout=30)
+        except requests.RequestException as e:
+            logger.error(f"Could not reach ollama: {e}")
+            return []
         
-        if result.returncode == 0:
+        if response.status_code == 200:
             available = []
-            lines = result.stdout.strip().split('\n')[1:]  # Skip header
+            models = json_loads(response.content).get('models', [])
+            names = [model['name'] for model in models]
+            
+            for model in models:
+                self.model_digests[model['name']] = model.get('digest')
+                # An untagged name resolves to :latest
+                base, _, tag = model['name'].partition(':')
+                if tag == 'latest':
+                    self.model_digests[base] = model.get('digest')
             
-            for line in lines:
-                if line:
-                    model_name = line.split()[0].split(':')[0]
-                    if model_name in self.models or model_name.startswith('fine-print'):
-                        available.append(model_name)
+            for name in names:
+                model_name = name.split(':')[0]
+                if model_name in self.models or model_name.startswith('fine-print'):
+                    available.append(model_name)
             
             # Check for GPT-OSS if it's been downloaded
-            if 'gpt-oss' in result.stdout.lower():
+            if any('gpt-oss' in name.lower() for name in names):
                 self.models.append("gpt-oss:20b")
                 available.append("gpt-oss:20b")
             
+            self.preload_models([m for m in available if m.startswith('fine-print')])
+            
             return available
         return []
     
@@ -120,27 +375,20 @@ class ModelTester:
             "test_details": []
         }
         
+        # Tests run one at a time in suite order; with nothing running
+        # concurrently, starting the slowest first would not shorten the run
         for test in test_cases:
-            logger.info(f"\nTest: {test['id']} ({test['category']})")
-            logger.info(f"Difficulty: {test['difficulty']}")
-            
-            start_time = time.time()
+            logger.info("\nTest: %s (%s)", test['id'], test['category'])
+            logger.info("Difficulty: %s", test['difficulty'])
             
             try:
                 # Run the model with extended timeout based on model size
                 timeout_seconds = 300 if 'gpt-oss' in model_name else 120
-                result = subprocess.run(
-                    ['ollama', 'run', model_name, test['prompt']],
-                    capture_output=True,
-                    text=True,
-                    timeout=timeout_seconds
-                )
-                
-                elapsed = time.time() - start_time
+                success, output, elapsed = self.generate(model_name, test['prompt'], timeout_seconds)
                 results["response_times"].append(elapsed)
                 
-                if result.returncode == 0:
-                    response = result.stdout
+                if success:
+                    response = output
                     
                     # Analyze response quality
                     analysis = self.analyze_response(response, test)
@@ -160,34 +408,35 @@ class ModelTester:
                     
                     if analysis["passed"]:
                         results["passed"] += 1
-                        logger.info(f"✅ PASSED - Time: {elapsed:.2f}s")
+                        logger.info("✅ PASSED - Time: %.2fs", elapsed)
                     else:
                         results["failed"] += 1
-                        logger.info(f"❌ FAILED - Missing required elements")
+                        logger.info("❌ FAILED - Missing required elements")
                     
-                    logger.info(f"Response preview: {response[:150]}...")
+                    logger.info("Response preview: %.150s...", response)
                     
                     # Extract score if present
                     if analysis["score"] is not None:
                         results["scores"].append(analysis["score"])
-                        logger.info(f"Risk Score: {analysis['score']}/100")
+                        logger.info("Risk Score: %s/100", analysis['score'])
                     
                     if analysis["grade"]:
-                        logger.info(f"Grade: {analysis['grade']}")
+                        logger.info("Grade: %s", analysis['grade'])
                     
-                    logger.info(f"Patterns detected: {', '.join(analysis['patterns_found']) if analysis['patterns_found'] else 'None'}")
+                    if logger.isEnabledFor(logging.INFO):
+                        logger.info("Patterns detected: %s", ', '.join(analysis['patterns_found']) or 'None')
                     
                 else:
                     results["failed"] += 1
                     results["test_details"].append({
                         "test_id": test["id"],
                         "category": test["category"],
-                        "error": result.stderr,
+                        "error": output,
                         "passed": False
                     })
-                    logger.error(f"❌ ERROR: {result.stderr[:100]}")
+                    logger.error("❌ ERROR: %.100s", output)
                     
-            except subprocess.TimeoutExpired:
+            except requests.Timeout:
                 results["failed"] += 1
                 results["test_details"].append({
                     "test_id": test["id"],
@@ -195,7 +444,7 @@ class ModelTester:
                     "error": "Timeout",
                     "passed": False
                 })
-                logger.error(f"❌ TIMEOUT - Test exceeded 120 seconds")
+                logger.error("❌ TIMEOUT - Test exceeded %d seconds", timeout_seconds)
             except Exception as e:
                 results["failed"] += 1
                 results["test_details"].append({
@@ -204,16 +453,18 @@ class ModelTester:
                     "error": str(e),
                     "passed": False
                 })
-                logger.error(f"❌ EXCEPTION: {str(e)}")
+                logger.error("❌ EXCEPTION: %s", e)
         
         # Calculate statistics
         if results["response_times"]:
-            results["avg_response_time"] = statistics.mean(results["response_times"])
-            results["median_response_time"] = statistics.median(results["response_times"])
+            rt = np.asarray(results["response_times"], dtype=np.float64)
+            results["avg_response_time"] = float(rt.mean())
+            results["median_response_time"] = float(np.median(rt))
         
         if results["scores"]:
-            results["avg_score"] = statistics.mean(results["scores"])
-            results["score_consistency"] = statistics.stdev(results["scores"]) if len(results["scores"]) > 1 else 0
+            scores = np.asarray(results["scores"], dtype=np.float64)
+            results["avg_score"] = float(scores.mean())
+            results["score_consistency"] = float(scores.std(ddof=1)) if scores.size > 1 else 0
         
         results["success_rate"] = (results["passed"] / results["total_tests"]) * 100 if results["total_tests"] > 0 else 0
         
@@ -232,31 +483,38 @@ class ModelTester:
         
         response_lower = response.lower()
         
-        # Check for risk score
-        for i in range(0, 101):
-            if f"{i}/100" in response or f"score: {i}" in response_lower:
+        if NUMBA_AVAILABLE and len(response) > COMPILED_SCAN_THRESHOLD:
+            # Long responses: find score and patterns in one compiled pass
+            mask, score = scan_response(
+                np.frombuffer(response_lower.encode(), dtype=np.uint8),
+                PATTERN_TRANSITIONS, PATTERN_OUTPUTS, SCORE_SUFFIX_BIT, SCORE_PREFIX_BIT
+            )
+            if score >= 0:
                 analysis["has_score"] = True
-                analysis["score"] = i
-                break
+                analysis["score"] = int(score)
+            analysis["patterns_found"] = [
+                pattern for bit, pattern in enumerate(COMMON_PATTERNS) if (mask >> bit) & 1
+            ]
+        else:
+            # Check for risk score
+            for i, fraction, label in SCORE_MARKERS:
+                if fraction in response or label in response_lower:
+                    analysis["has_score"] = True
+                    analysis["score"] = i
+                    break
+            
+            # Check for pattern detection
+            for pattern in COMMON_PATTERNS:
+                if pattern in response_lower:
+                    analysis["patterns_found"].append(pattern)
         
         # Check for grade
-        for grade in ['A', 'B', 'C', 'D', 'F']:
-            if f"grade: {grade}" in response or f"Grade: {grade}" in response:
+        for grade, lower_label, title_label in GRADE_MARKERS:
+            if lower_label in response or title_label in response:
                 analysis["has_grade"] = True
                 analysis["grade"] = grade
                 break
         
-        # Check for pattern detection
-        common_patterns = [
-            "data sharing", "third parties", "arbitration", "data collection",
-            "tracking", "cookies", "permissions", "liability", "termination",
-            "content license", "privacy", "security"
-        ]
-        
-        for pattern in common_patterns:
-            if pattern in response_lower:
-                analysis["patterns_found"].append(pattern)
-        
         # Determine if test passed
         if test["difficulty"] == "low":
             # Simple tests just need a response
@@ -294,8 +552,14 @@ class ModelTester:
                 logger.info(f"  Score Consistency (σ): {result['score_consistency']:.2f}")
         
         # Determine winner
-        best_model = max(all_results, key=lambda x: x['success_rate'])
-        fastest_model = min(all_results, key=lambda x: x.get('avg_response_time', float('inf')))
+        best_model = fastest_model = all_results[0]
+        fastest_time = fastest_model.get('avg_response_time', float('inf'))
+        for result in all_results[1:]:
+            if result['success_rate'] > best_model['success_rate']:
+                best_model = result
+            response_time = result.get('avg_response_time', float('inf'))
+            if response_time < fastest_time:
+                fastest_model, fastest_time = result, response_time
         
         logger.info("\n🏆 Results:")
         logger.info(f"  Best Accuracy: {best_model['model']} ({best_model['success_rate']:.1f}%)")
@@ -303,27 +567,20 @@ class ModelTester:
         
         # Category breakdown
         logger.info("\n📈 Performance by Category:")
-        categories = {}
+        # category -> model -> [passed, total]
+        categories = defaultdict(lambda: defaultdict(lambda: [0, 0]))
         
         for result in all_results:
             for detail in result.get('test_details', []):
-                category = detail.get('category', 'Unknown')
-                if category not in categories:
-                    categories[category] = {}
-                
-                model = result['model']
-                if model not in categories[category]:
-                    categories[category][model] = {'passed': 0, 'total': 0}
-                
-                categories[category][model]['total'] += 1
-                if detail.get('passed', False):
-                    categories[category][model]['passed'] += 1
+                bucket = categories[detail.get('category', 'Unknown')][result['model']]
+                bucket[1] += 1
+                bucket[0] += bool(detail.get('passed', False))
         
         for category, models in categories.items():
             logger.info(f"\n  {category}:")
-            for model, stats in models.items():
-                success_rate = (stats['passed'] / stats['total'] * 100) if stats['total'] > 0 else 0
-                logger.info(f"    {model}: {stats['passed']}/{stats['total']} ({success_rate:.0f}%)")
+            for model, (passed, total) in models.items():
+                success_rate = (passed / total * 100) if total > 0 else 0
+                logger.info(f"    {model}: {passed}/{total} ({success_rate:.0f}%)")
         
         return best_model['model']
     
@@ -337,15 +594,26 @@ class ModelTester:
         }
         
         output_file = "model-comparison-results.json"
-        with open(output_file, 'w') as f:
-            json.dump(output, f, indent=2)
+        if orjson is not None:
+            with open(output_file, 'wb') as f:
+                f.write(orjson.dumps(output, option=orjson.OPT_SERIALIZE_NUMPY))
+        else:
+            with open(output_file, 'w') as f:
+                json.dump(output, f)
         
         logger.info(f"\n💾 Results saved to {output_file}")
 
 def main():
     """Run comprehensive model testing"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Test and compare fine-tuned models")
+    parser.add_argument("--cache", action="store_true",
+                       help="Reuse responses cached by earlier runs of the same model build and prompt")
+    
+    args = parser.parse_args()
     
-    tester = ModelTester()
+    tester = ModelTester(use_cache=args.cache)
     
     # Check available models
     available = tester.check_available_models()
@@ -365,10 +633,13 @@ def main():
     
     # Test each model
     all_results = []
-    for model in available:
-        if model.startswith('fine-print'):
-            result = tester.test_model(model, test_cases)
-            all_results.append(result)
+    try:
+        for model in available:
+            if model.startswith('fine-print'):
+                result = tester.test_model(model, test_cases)
+                all_results.append(result)
+    finally:
+        tester.release_models([m for m in available if m.startswith('fine-print')])
     
     if all_results:
         # Compare and report
@@ -6,12 +6,16 @@ Trains the model on privacy policy analysis dataset
 
 import json
 import os
+import hashlib
 import sys
 import argparse
+import importlib.util
+import numpy as np
 import torch
+from torch.utils.checkpoint import checkpoint
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import logging
 from dataclasses import dataclass
 from transformers import (
@@ -19,7 +23,7 @@ from transformers import (
     AutoTokenizer,
     TrainingArguments,
     Trainer,
-    DataCollatorForLanguageModeling,
+    DataCollatorForSeq2Seq,
     BitsAndBytesConfig
 )
 from peft import (
@@ -28,7 +32,8 @@ from peft import (
     prepare_model_for_kbit_training,
     TaskType
 )
-from datasets import Dataset
+from datasets import Dataset, DatasetDict, load_dataset, load_from_disk
+from datasets.fingerprint import Hasher
 import bitsandbytes as bnb
 from accelerate import Accelerator
 
@@ -51,8 +56,8 @@ class ModelConfig:
     max_length: int = 2048
     temperature: float = 0.7
     top_p: float = 0.9
-    use_8bit: bool = True
-    use_4bit: bool = False
+    use_8bit: bool = False
+    use_4bit: bool = True  # QLoRA: NF4 weights with double quantization
 
 @dataclass
 class LoRAConfig:
@@ -85,63 +90,142 @@ class TrainingConfig:
     logging_steps: int = 10
     save_steps: int = 500
     eval_steps: int = 100
-    save_total_limit: int = 3
-    fp16: bool = True
+    eval_subset_size: int = 256  # periodic evals use a fixed random subset; 0 = full set
+    save_total_limit: Optional[int] = None  # adapter-only checkpoints are small enough to keep
+    precision: str = "auto"  # "bf16", "fp16", or "auto" (bf16 where supported)
     gradient_checkpointing: bool = True
+    # Recompute only the MLP blocks (dense_h_to_4h/dense_4h_to_h) rather than whole layers
+    selective_checkpointing: bool = True
+    optim: str = "paged_adamw_8bit"  # bitsandbytes PagedAdamW8bit
+    # Opt-in; needs unquantized weights. Compiled runs pad every row to
+    # max_length so reduce-overhead's CUDA graphs are recorded for one shape.
+    compile_model: bool = False
     output_dir: str = "./gpt-oss-privacy-lora"
     hub_model_id: str = "fine-print-ai/gpt-oss-privacy-analyzer"
 
+def resolve_precision(precision: str) -> str:
+    """Resolve "auto" to bf16 on GPUs that support it (Ampere/Hopper), else fp16"""
+    if precision == "auto":
+        return "bf16" if torch.cuda.is_available() and torch.cuda.is_bf16_supported() else "fp16"
+    return precision
+
 class PrivacyDatasetProcessor:
     """Process the privacy analysis dataset for training"""
     
-    def __init__(self, tokenizer, max_length: int = 2048):
+    # Bump whenever build_prompt/build_response or label construction changes,
+    # so stale tokenized caches are not reused
+    TEMPLATE_VERSION = 4
+    
+    def __init__(self, tokenizer, max_length: int = 2048, pad_to_max_length: bool = False):
         self.tokenizer = tokenizer
         self.max_length = max_length
+        self.pad_to_max_length = pad_to_max_length
         
-    def load_dataset(self, file_path: str) -> List[Dict]:
-        """Load JSONL dataset"""
-        logger.info(f"Loading dataset from {file_path}")
-        data = []
-        with open(file_path, 'r') as f:
-            for line in f:
-                data.append(json.loads(line.strip()))
-        logger.info(f"Loaded {len(data)} examples")
-        return data
-    
-    def format_prompt(self, example: Dict) -> str:
-        """Format training example into prompt"""
-        prompt = f"""### Instruction:
-{example['instruction']}
+    def build_prompt_parts(self, instruction: str) -> Tuple[str, str]:
+        """Format the unsupervised text before and after the input document"""
+        head = f"""### Instruction:
+{instruction}
 
 ### Input:
-{example['input']}
+"""
+        tail = """
 
 ### Response:
-{example['output']}"""
-        return prompt
+"""
+        return head, tail
     
-    def tokenize_function(self, examples: Dict) -> Dict:
-        """Tokenize examples for training"""
-        texts = [self.format_prompt(ex) for ex in examples['data']]
-        
-        model_inputs = self.tokenizer(
-            texts,
-            max_length=self.max_length,
-            padding="max_length",
-            truncation=True,
-            return_tensors="pt"
-        )
+    def build_prompt(self, instruction: str, input_text: str) -> str:
+        """Format the unsupervised part of an example, up to the response marker"""
+        head, tail = self.build_prompt_parts(instruction)
+        return head + input_text + tail
+    
+    def build_response(self, output: str) -> str:
+        """Format the supervised part of an example"""
+        return output
+    
+    def format_prompt(self, instruction: str, input_text: str, output: str) -> str:
+        """Format training example into prompt"""
+        return self.build_prompt(instruction, input_text) + self.build_response(output)
+    
+    def tokenize_function(self, examples: Dict[str, List]) -> Dict:
+        """Tokenize a batch of examples (column-oriented, as passed by Dataset.map(batched=True))"""
+        parts = [self.build_prompt_parts(instruction) for instruction in examples['instruction']]
         
-        # Set labels same as input_ids for causal LM
-        model_inputs["labels"] = model_inputs["input_ids"].clone()
+        def encode(texts: List[str]) -> List[List[int]]:
+            return self.tokenizer(texts, add_special_tokens=False)["input_ids"]
+        
+        heads = encode([head for head, _ in parts])
+        tails = encode([tail for _, tail in parts])
+        inputs = encode(examples['input'])
+        responses = encode([self.build_response(output) for output in examples['output']])
+        
+        model_inputs = {"input_ids": [], "attention_mask": [], "labels": [], "length": []}
+        for head, input_ids, tail, response in zip(heads, inputs, tails, responses):
+            # Over-long examples lose the end of the input document, not the
+            # response; the response itself is only cut if it cannot fit
+            # next to the prompt markers on its own
+            response = response[:max(self.max_length - len(head) - len(tail), 0)]
+            if not response:
+                # Nothing to supervise; such rows would only add NaN losses
+                continue
+            input_ids = input_ids[:self.max_length - len(head) - len(tail) - len(response)]
+            prompt_len = len(head) + len(input_ids) + len(tail)
+            
+            ids = head + input_ids + tail + response
+            # Only the response is supervised; prompt and pad tokens are
+            # ignored by the loss. Unless fixed shapes are requested, the
+            # collator pads each batch to its own longest row.
+            padding = self.max_length - len(ids) if self.pad_to_max_length else 0
+            model_inputs["input_ids"].append(ids + [self.tokenizer.pad_token_id] * padding)
+            model_inputs["attention_mask"].append([1] * len(ids) + [0] * padding)
+            model_inputs["labels"].append([-100] * prompt_len + response + [-100] * padding)
+            # Unpadded lengths let the Trainer bucket similar-length rows together
+            model_inputs["length"].append(len(ids))
         
         return model_inputs
     
-    def prepare_dataset(self, data: List[Dict]) -> Dataset:
-        """Prepare dataset for training"""
-        # Convert to HuggingFace Dataset
-        dataset_dict = {"data": data}
-        dataset = Dataset.from_dict(dataset_dict)
+    def cache_key(self, file_path: str) -> str:
+        """Key tokenized data by tokenizer, template, tokenization settings and source file"""
+        stat = os.stat(file_path)
+        parts = [
+            Hasher.hash(self.tokenizer),
+            str(self.TEMPLATE_VERSION),
+            str(self.max_length),
+            str(self.pad_to_max_length),
+            os.path.abspath(file_path),
+            str(stat.st_size),
+            str(stat.st_mtime_ns),
+        ]
+        return hashlib.sha256("\0".join(parts).encode()).hexdigest()[:16]
+    
+    def load_tokenized_dataset(self, file_path: str, cache_dir: str) -> DatasetDict:
+        """Return tokenized train/test splits, reusing an on-disk Arrow copy when valid"""
+        cache_path = os.path.join(cache_dir, f"tokenized_{self.cache_key(file_path)}")
+        if os.path.isdir(cache_path):
+            logger.info(f"Loading tokenized dataset from cache {cache_path}")
+            return load_from_disk(cache_path)
+        
+        dataset = self.prepare_dataset(file_path)
+        
+        # Tokenize in large batches across all cores
+        tokenized = dataset.map(
+            self.tokenize_function,
+            batched=True,
+            batch_size=1000,
+            num_proc=os.cpu_count() or 1,
+            remove_columns=dataset['train'].column_names
+        )
+        
+        tokenized.save_to_disk(cache_path)
+        logger.info(f"Cached tokenized dataset at {cache_path}")
+        return tokenized
+    
+    def prepare_dataset(self, file_path: str) -> DatasetDict:
+        """Load a JSONL dataset (via the Arrow JSON reader) and split it for training"""
+        logger.info(f"Loading dataset from {file_path}")
+        dataset = load_dataset("json", data_files=file_path, split="train")
+        dataset = dataset.select_columns(["instruction", "input", "output"])
+        logger.info(f"Loaded {len(dataset)} examples")
         
         # Split into train and validation
         split_dataset = dataset.train_test_split(test_size=0.1, seed=42)
@@ -151,6 +235,68 @@ class PrivacyDatasetProcessor:
         
         return split_dataset
 
+def checkpoint_mlp_blocks(model) -> int:
+    """Wrap every GPT-NeoX MLP block in non-reentrant activation checkpointing.
+    
+    The MLP's 4x-hidden activations dominate memory but are cheap to
+    recompute; attention is left alone so its fused backward is kept.
+    Returns the number of blocks wrapped.
+    """
+    wrapped = 0
+    for module in model.modules():
+        if module.__class__.__name__ != "GPTNeoXMLP":
+            continue
+        
+        def forward(hidden_states, _forward=module.forward):
+            if torch.is_grad_enabled():
+                return checkpoint(_forward, hidden_states, use_reentrant=False)
+            return _forward(hidden_states)
+        
+        module.forward = forward
+        wrapped += 1
+    return wrapped
+
+def collate_fixed_length(batch: List[Dict]) -> Dict[str, torch.Tensor]:
+    """Stack rows that were already padded to the same length"""
+    return {
+        key: torch.tensor([row[key] for row in batch])
+        for key in ("input_ids", "attention_mask", "labels")
+    }
+
+class PrivacyLoRATrainer(Trainer):
+    """Trainer that checkpoints only the LoRA adapter weights (as safetensors)
+    and runs periodic evaluation on a fixed random subset of the eval set"""
+    
+    def __init__(self, *args, eval_subset_size: int = 0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.eval_subset_size = eval_subset_size
+        self._eval_subset = None
+    
+    def evaluate(self, eval_dataset=None, ignore_keys=None, metric_key_prefix: str = "eval"):
+        if eval_dataset is None and self.eval_subset_size:
+            if self._eval_subset is None:
+                self._eval_subset = self.eval_dataset
+                if len(self.eval_dataset) > self.eval_subset_size:
+                    # Same rows every time so scores stay comparable across steps
+                    rng = np.random.default_rng(self.args.seed)
+                    indices = rng.choice(len(self.eval_dataset), self.eval_subset_size, replace=False)
+                    self._eval_subset = self.eval_dataset.select(np.sort(indices))
+            eval_dataset = self._eval_subset
+        return super().evaluate(eval_dataset, ignore_keys, metric_key_prefix)
+    
+    def _save(self, output_dir: Optional[str] = None, state_dict=None):
+        output_dir = output_dir if output_dir is not None else self.args.output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        logger.info(f"Saving adapter checkpoint to {output_dir}")
+        
+        # Unwrap torch.compile so PEFT's save_pretrained writes just the adapter
+        model = getattr(self.model, "_orig_mod", self.model)
+        model.save_pretrained(output_dir, safe_serialization=True)
+        
+        if self.tokenizer is not None:
+            self.tokenizer.save_pretrained(output_dir)
+        torch.save(self.args, os.path.join(output_dir, "training_args.bin"))
+
 class GPTOSSLoRATrainer:
     """Main trainer class for GPT-OSS LoRA fine-tuning"""
     
@@ -163,8 +309,14 @@ class GPTOSSLoRATrainer:
         self.model_config = model_config
         self.lora_config = lora_config
         self.training_config = training_config
+        self.precision = resolve_precision(training_config.precision)
+        self.compute_dtype = torch.bfloat16 if self.precision == "bf16" else torch.float16
         self.accelerator = Accelerator()
         
+        # transformers refuses to fine-tune a compiled bitsandbytes model
+        if training_config.compile_model and (model_config.use_4bit or model_config.use_8bit):
+            raise ValueError("torch.compile cannot be used with a quantized model; load it with --no-quantize")
+        
     def setup_model_and_tokenizer(self):
         """Load model and tokenizer with quantization"""
         logger.info("Loading tokenizer...")
@@ -179,27 +331,53 @@ class GPTOSSLoRATrainer:
         if self.model_config.use_8bit:
             bnb_config = BitsAndBytesConfig(
                 load_in_8bit=True,
-                bnb_8bit_compute_dtype=torch.float16
+                bnb_8bit_compute_dtype=self.compute_dtype
             )
         elif self.model_config.use_4bit:
             bnb_config = BitsAndBytesConfig(
                 load_in_4bit=True,
                 bnb_4bit_quant_type="nf4",
-                bnb_4bit_compute_dtype=torch.float16,
-                bnb_4bit_use_double_quant=True
+                bnb_4bit_compute_dtype=self.compute_dtype,
+                bnb_4bit_use_double_quant=True,
+                bnb_4bit_quant_storage=self.compute_dtype
             )
         
-        logger.info("Loading model...")
+        # Fused FlashAttention-2 kernels need Ampere+ and the flash_attn package
+        attn_implementation = "sdpa"
+        if (
+            torch.cuda.is_available()
+            and torch.cuda.get_device_capability()[0] >= 8
+            and importlib.util.find_spec("flash_attn") is not None
+        ):
+            attn_implementation = "flash_attention_2"
+        
+        logger.info(f"Loading model with {attn_implementation} attention...")
         self.model = AutoModelForCausalLM.from_pretrained(
             self.model_config.model_path,
             quantization_config=bnb_config,
             device_map="auto",
             trust_remote_code=True,
-            torch_dtype=torch.float16
+            torch_dtype=self.compute_dtype,
+            attn_implementation=attn_implementation
         )
         
-        # Prepare model for k-bit training
-        self.model = prepare_model_for_kbit_training(self.model)
+        # Prepare model for k-bit training (also upcasts layer norms and
+        # embeddings to fp32 for stability)
+        full_checkpointing = (
+            self.training_config.gradient_checkpointing
+            and not self.training_config.selective_checkpointing
+        )
+        self.model = prepare_model_for_kbit_training(
+            self.model,
+            use_gradient_checkpointing=full_checkpointing,
+            gradient_checkpointing_kwargs={"use_reentrant": False}
+        )
+        
+        if self.training_config.gradient_checkpointing and self.training_config.selective_checkpointing:
+            wrapped = checkpoint_mlp_blocks(self.model)
+            logger.info(f"Selective checkpointing enabled on {wrapped} MLP blocks")
+            if wrapped == 0:
+                logger.warning("No GPT-NeoX MLP blocks found; activations will not be checkpointed")
         
         # Apply LoRA
         logger.info("Applying LoRA configuration...")
@@ -215,6 +393,16 @@ class GPTOSSLoRATrainer:
         self.model = get_peft_model(self.model, peft_config)
         self.model.print_trainable_parameters()
         
+        if self.training_config.compile_model:
+            # Batches are padded to max_length, so the shapes are static
+            logger.info("Compiling model with torch.compile...")
+            self.model = torch.compile(
+                self.model,
+                mode="reduce-overhead",
+                fullgraph=False,
+                dynamic=False
+            )
+        
     def train(self, train_dataset: Dataset, eval_dataset: Dataset):
         """Run the training loop"""
         # Training arguments
@@ -224,18 +412,34 @@ class GPTOSSLoRATrainer:
             per_device_train_batch_size=self.training_config.batch_size,
             per_device_eval_batch_size=self.training_config.batch_size,
             gradient_accumulation_steps=self.training_config.gradient_accumulation_steps,
-            gradient_checkpointing=self.training_config.gradient_checkpointing,
+            # Every trainable (LoRA) parameter is used in each forward pass,
+            # so DDP need not walk the graph looking for unused ones
+            ddp_find_unused_parameters=False,
+            # Selective checkpointing is applied to the model directly
+            gradient_checkpointing=(
+                self.training_config.gradient_checkpointing
+                and not self.training_config.selective_checkpointing
+            ),
+            gradient_checkpointing_kwargs={"use_reentrant": False},
             warmup_steps=self.training_config.warmup_steps,
             logging_steps=self.training_config.logging_steps,
             save_steps=self.training_config.save_steps,
             eval_steps=self.training_config.eval_steps,
             save_total_limit=self.training_config.save_total_limit,
+            save_safetensors=True,
             evaluation_strategy="steps",
             save_strategy="steps",
             load_best_model_at_end=True,
-            fp16=self.training_config.fp16,
-            bf16=False,
+            group_by_length=not self.training_config.compile_model,
+            length_column_name="length",
+            # torch.compile hides forward()'s signature from the Trainer's
+            # column pruning; the collators select model inputs themselves
+            remove_unused_columns=False,
+            fp16=self.precision == "fp16",
+            bf16=self.precision == "bf16",
             learning_rate=self.training_config.learning_rate,
+            optim=self.training_config.optim,
+            torch_compile=False,  # compiled in setup_model_and_tokenizer
             logging_dir=f"{self.training_config.output_dir}/logs",
             report_to=["tensorboard"],
             push_to_hub=False,
@@ -243,20 +447,33 @@ class GPTOSSLoRATrainer:
             hub_strategy="every_save"
         )
         
-        # Data collator
-        data_collator = DataCollatorForLanguageModeling(
-            tokenizer=self.tokenizer,
-            mlm=False
-        )
+        # Data collator: pad per batch, keeping padded label positions out of the loss
+        if self.training_config.compile_model:
+            data_collator = collate_fixed_length
+        else:
+            seq2seq_collator = DataCollatorForSeq2Seq(
+                tokenizer=self.tokenizer,
+                padding="longest",
+                pad_to_multiple_of=8,
+                label_pad_token_id=-100
+            )
+            
+            def data_collator(features):
+                # The length column is only for the sampler, not a model input
+                return seq2seq_collator([
+                    {key: value for key, value in feature.items() if key != "length"}
+                    for feature in features
+                ])
         
         # Create trainer
-        trainer = Trainer(
+        trainer = PrivacyLoRATrainer(
             model=self.model,
             args=training_args,
             train_dataset=train_dataset,
             eval_dataset=eval_dataset,
             data_collator=data_collator,
-            tokenizer=self.tokenizer
+            tokenizer=self.tokenizer,
+            eval_subset_size=self.training_config.eval_subset_size
         )
         
         # Start training
@@ -275,7 +492,7 @@ class GPTOSSLoRATrainer:
         
         # Create Modelfile for Ollama
         modelfile_content = f"""FROM gpt-oss:20b
-ADAPTER {adapter_path}/adapter_model.bin
+ADAPTER {adapter_path}/adapter_model.safetensors
 PARAMETER temperature {self.model_config.temperature}
 PARAMETER top_p {self.model_config.top_p}
 PARAMETER max_length {self.model_config.max_length}
@@ -332,19 +549,35 @@ def main():
                        help="Learning rate")
     parser.add_argument("--lora-r", type=int, default=64,
                        help="LoRA rank")
-    parser.add_argument("--use-4bit", action="store_true",
-                       help="Use 4-bit quantization instead of 8-bit")
+    parser.add_argument("--use-8bit", action="store_true",
+                       help="Use 8-bit quantization instead of 4-bit NF4")
+    parser.add_argument("--precision", choices=["auto", "bf16", "fp16"], default="auto",
+                       help="Mixed-precision mode (auto picks bf16 on Ampere/Hopper GPUs)")
+    parser.add_argument("--no-quantize", action="store_true",
+                       help="Load unquantized base weights in the compute dtype (required for --compile)")
+    parser.add_argument("--compile", action="store_true",
+                       help="torch.compile the PEFT model, padding every example to max length for static shapes")
+    parser.add_argument("--full-checkpointing", action="store_true",
+                       help="Checkpoint whole transformer layers instead of only MLP blocks")
+    parser.add_argument("--cache-dir", type=str, default=".cache/tokenized",
+                       help="Directory for cached tokenized datasets")
     
     args = parser.parse_args()
     
     # Configure models
-    model_config = ModelConfig(use_4bit=args.use_4bit, use_8bit=not args.use_4bit)
+    model_config = ModelConfig(
+        use_4bit=not (args.use_8bit or args.no_quantize),
+        use_8bit=args.use_8bit and not args.no_quantize
+    )
     lora_config = LoRAConfig(r=args.lora_r)
     training_config = TrainingConfig(
         output_dir=args.output_dir,
         num_epochs=args.epochs,
         batch_size=args.batch_size,
-        learning_rate=args.learning_rate
+        learning_rate=args.learning_rate,
+        precision=args.precision,
+        selective_checkpointing=not args.full_checkpointing,
+        compile_model=args.compile
     )
     
     # Initialize trainer
@@ -354,25 +587,15 @@ def main():
     trainer.setup_model_and_tokenizer()
     
     # Process dataset
-    processor = PrivacyDatasetProcessor(trainer.tokenizer)
-    raw_data = processor.load_dataset(args.dataset)
-    dataset = processor.prepare_dataset(raw_data)
-    
-    # Tokenize datasets
-    tokenized_train = dataset['train'].map(
-        lambda x: processor.tokenize_function({"data": [x]}),
-        batched=False,
-        remove_columns=dataset['train'].column_names
-    )
-    
-    tokenized_eval = dataset['test'].map(
-        lambda x: processor.tokenize_function({"data": [x]}),
-        batched=False,
-        remove_columns=dataset['test'].column_names
+    processor = PrivacyDatasetProcessor(
+        trainer.tokenizer,
+        max_length=model_config.max_length,
+        pad_to_max_length=training_config.compile_model
     )
+    tokenized = processor.load_tokenized_dataset(args.dataset, args.cache_dir)
     
     # Train the model
-    trainer.train(tokenized_train, tokenized_eval)
+    trainer.train(tokenized['train'], tokenized['test'])
     
     # Create Ollama adapter
     adapter_path = f"{args.output_dir}/ollama-adapter"
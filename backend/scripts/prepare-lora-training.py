@@ -5,114 +5,211 @@ Converts exported training data to format suitable for Unsloth/LoRA fine-tuning
 """
 
 import json
+import multiprocessing
 import os
-from typing import List, Dict, Any
+from contextlib import ExitStack
+from functools import lru_cache, partial
+from typing import List, Dict, Any, Iterable, Iterator, Tuple
 import argparse
 from datetime import datetime
 
-def create_alpaca_format(entry: Dict[str, Any]) -> Dict[str, str]:
-    """Convert training entry to Alpaca instruction format"""
-    
-    # Create instruction based on document type
-    if entry['document_type'] == 'privacy_policy':
-        instruction = "Analyze this privacy policy and identify problematic patterns, provide a risk score, and summarize key findings."
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    orjson = None
+    json_loads = json.loads
+
+# Bytes read from the input JSONL files at a time
+READ_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Entries handed to each pool worker per task
+FORMAT_CHUNKSIZE = 256
+
+# Marker shown before each pattern in conversational responses
+SEVERITY_EMOJI = {'high': '🔴', 'medium': '🟡'}
+
+# Content is truncated to a reasonable length for training
+MAX_CONTENT_CHARS = 2000
+
+TERMS_INSTRUCTION = "Analyze this terms of service and identify problematic clauses, provide a risk score, and summarize key findings."
+INSTRUCTIONS = {
+    'privacy_policy': "Analyze this privacy policy and identify problematic patterns, provide a risk score, and summarize key findings.",
+}
+
+SYSTEM_PROMPT = "You are Fine Print AI, an expert at analyzing legal documents to identify problematic patterns and protect user rights. Provide clear, actionable analysis with risk scores."
+
+def iter_jsonl(path: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """Yield entries from a JSONL file, reading it in large byte chunks"""
+    # Splitting whole chunks on b'\n' avoids the per-line file iterator;
+    # the partial last line of each chunk is carried into the next one
+    tail = b''
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            lines = (tail + chunk).split(b'\n')
+            tail = lines.pop()
+            for line in lines:
+                if line:
+                    yield json_loads(line)
+    if tail.strip():
+        yield json_loads(tail)
+
+def write_json(path: str, obj: Any) -> None:
+    """Write obj to path as indented JSON"""
+    if orjson is not None:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
     else:
-        instruction = "Analyze this terms of service and identify problematic clauses, provide a risk score, and summarize key findings."
-    
-    # Truncate content to reasonable length for training
-    content = entry['content'][:2000] + "..." if len(entry['content']) > 2000 else entry['content']
-    
-    # Format the input
-    input_text = f"Document Type: {entry['document_type']}\nCategory: {entry['category']}\n\n{content}"
-    
-    # Format the expected output
+        with open(path, 'w') as f:
+            json.dump(obj, f, indent=2)
+
+def jsonl_line(record: Any) -> bytes:
+    """Serialize record as one newline-terminated JSONL line"""
+    if orjson is not None:
+        return orjson.dumps(record) + b'\n'
+    return json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n'
+
+def write_jsonl_files(paths: List[str], rows: Iterable[Tuple[bytes, ...]]) -> None:
+    """Write each column of pre-serialized rows to its own JSONL file"""
+    with ExitStack() as stack:
+        files = [stack.enter_context(open(path, 'wb')) for path in paths]
+        for row in rows:
+            for f, line in zip(files, row):
+                f.write(line)
+
+def truncate_content(content: str) -> str:
+    """Truncate document content, returning short content untouched"""
+    if len(content) <= MAX_CONTENT_CHARS:
+        return content
+    return content[:MAX_CONTENT_CHARS] + "..."
+
+@lru_cache(maxsize=None)
+def pattern_title(pattern_type: str) -> str:
+    """Human-readable title for a pattern type, e.g. data_sharing -> Data Sharing"""
+    # Pattern types come from a small fixed vocabulary, so each is titled once
+    return pattern_type.replace('_', ' ').title()
+
+def preformat_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Extract the fields shared by every output format from a training entry"""
     analysis = entry['analysis']
-    output_parts = [
-        f"Risk Score: {analysis['score']}/100 (Grade: {analysis['grade']})",
-        "",
-        "Problematic Patterns Found:"
-    ]
-    
-    for pattern in analysis['patterns'][:5]:  # Limit to top 5 patterns
-        output_parts.append(f"- {pattern['type']} ({pattern['severity']}): {pattern['description']}")
-    
-    output_parts.extend([
-        "",
-        "Key Findings:"
-    ])
+    document_type = entry['document_type']
+    return {
+        'document_type': document_type,
+        'doc_type': "privacy policy" if document_type == 'privacy_policy' else "terms of service",
+        'category': entry['category'],
+        'content': truncate_content(entry['content']),
+        'risk_score': f"Risk Score: {analysis['score']}/100 (Grade: {analysis['grade']})",
+        'patterns': analysis['patterns'],
+        'findings': analysis['findings'],
+        'summary': analysis['summary'],
+    }
+
+def create_alpaca_format(pre: Dict[str, Any]) -> Dict[str, str]:
+    """Convert a preformatted entry to Alpaca instruction format"""
+    document_type = pre['document_type']
     
-    for finding in analysis['findings'][:3]:  # Limit to top 3 findings
-        output_parts.append(f"- {finding['title']}: {finding['explanation']}")
+    # Create instruction based on document type
+    instruction = INSTRUCTIONS.get(document_type, TERMS_INSTRUCTION)
     
-    output_parts.extend([
-        "",
-        f"Summary: {analysis['summary']}"
-    ])
+    # Format the input
+    input_text = f"Document Type: {document_type}\nCategory: {pre['category']}\n\n{pre['content']}"
+    
+    # Format the expected output. Each list item carries its own leading
+    # newline so empty sections collapse cleanly inside the template.
+    patterns = "".join(
+        f"\n- {pattern['type']} ({pattern['severity']}): {pattern['description']}"
+        for pattern in pre['patterns'][:5]  # Limit to top 5 patterns
+    )
+    findings = "".join(
+        f"\n- {finding['title']}: {finding['explanation']}"
+        for finding in pre['findings'][:3]  # Limit to top 3 findings
+    )
+    output = (
+        f"{pre['risk_score']}\n"
+        f"\n"
+        f"Problematic Patterns Found:{patterns}\n"
+        f"\n"
+        f"Key Findings:{findings}\n"
+        f"\n"
+        f"Summary: {pre['summary']}"
+    )
     
     return {
         "instruction": instruction,
         "input": input_text,
-        "output": "\n".join(output_parts)
+        "output": output
     }
 
-def create_conversational_format(entry: Dict[str, Any]) -> List[Dict[str, str]]:
-    """Convert to conversational format for chat fine-tuning"""
-    
-    messages = []
-    
-    # System message
-    messages.append({
-        "role": "system",
-        "content": "You are Fine Print AI, an expert at analyzing legal documents to identify problematic patterns and protect user rights. Provide clear, actionable analysis with risk scores."
-    })
-    
-    # User message
-    doc_type = "privacy policy" if entry['document_type'] == 'privacy_policy' else "terms of service"
-    content = entry['content'][:2000] + "..." if len(entry['content']) > 2000 else entry['content']
-    
-    messages.append({
-        "role": "user",
-        "content": f"Please analyze this {doc_type} from a {entry['category']} company:\n\n{content}"
-    })
+def create_conversational_format(pre: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Convert a preformatted entry to conversational format for chat fine-tuning"""
+    doc_type = pre['doc_type']
+    severity_emoji = SEVERITY_EMOJI.get
     
     # Assistant response
-    analysis = entry['analysis']
-    response_parts = [
-        f"I've analyzed this {doc_type} and found several important issues:",
-        "",
-        f"**Risk Score: {analysis['score']}/100 (Grade: {analysis['grade']})**",
-        "",
-        "**Problematic Patterns:**"
+    patterns = "".join(
+        f"\n{severity_emoji(pattern['severity'], '🟢')} "
+        f"**{pattern_title(pattern['type'])}**: {pattern['description']}"
+        for pattern in pre['patterns']
+    )
+    findings = "".join(
+        f"\n{i}. **{finding['title']}**: {finding['explanation']}"
+        for i, finding in enumerate(pre['findings'][:5], 1)
+    )
+    
+    return [
+        # System message
+        {
+            "role": "system",
+            "content": SYSTEM_PROMPT
+        },
+        # User message
+        {
+            "role": "user",
+            "content": f"Please analyze this {doc_type} from a {pre['category']} company:\n\n{pre['content']}"
+        },
+        {
+            "role": "assistant",
+            "content": (
+                f"I've analyzed this {doc_type} and found several important issues:\n"
+                f"\n"
+                f"**{pre['risk_score']}**\n"
+                f"\n"
+                f"**Problematic Patterns:**{patterns}\n"
+                f"\n"
+                f"**Key Concerns:**{findings}\n"
+                f"\n"
+                f"**Summary:** {pre['summary']}\n"
+                f"\n"
+                "I recommend carefully reviewing these sections before agreeing to these terms. Consider looking for alternative services with more user-friendly policies if these concerns are significant to you."
+            )
+        },
     ]
-    
-    for pattern in analysis['patterns']:
-        severity_emoji = "🔴" if pattern['severity'] == 'high' else "🟡" if pattern['severity'] == 'medium' else "🟢"
-        response_parts.append(f"{severity_emoji} **{pattern['type'].replace('_', ' ').title()}**: {pattern['description']}")
-    
-    response_parts.extend([
-        "",
-        "**Key Concerns:**"
-    ])
-    
-    for i, finding in enumerate(analysis['findings'][:5], 1):
-        response_parts.append(f"{i}. **{finding['title']}**: {finding['explanation']}")
-    
-    response_parts.extend([
-        "",
-        f"**Summary:** {analysis['summary']}",
-        "",
-        "I recommend carefully reviewing these sections before agreeing to these terms. Consider looking for alternative services with more user-friendly policies if these concerns are significant to you."
-    ])
-    
-    messages.append({
-        "role": "assistant",
-        "content": "\n".join(response_parts)
-    })
-    
-    return messages
 
-def create_specialized_datasets(entries: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
-    """Create specialized datasets for different document categories"""
+def create_conversation_record(pre: Dict[str, Any]) -> Dict[str, List[Dict[str, str]]]:
+    """Wrap the conversational format in an object so it can be a JSONL row"""
+    return {"messages": create_conversational_format(pre)}
+
+# Output formats, in the order their files are written
+FORMATTERS = {
+    'alpaca': create_alpaca_format,
+    'conversation': create_conversation_record,
+}
+FORMAT_LABELS = {
+    'alpaca': 'Alpaca',
+    'conversation': 'conversational',
+}
+
+def format_entry(entry: Dict[str, Any], formats: Tuple[str, ...]) -> Tuple[bytes, ...]:
+    """Render one entry in each requested format as serialized JSONL lines"""
+    # The shared fields are extracted once and reused by every format
+    pre = preformat_entry(entry)
+    return tuple(jsonl_line(FORMATTERS[name](pre)) for name in formats)
+
+def create_specialized_datasets(entries: Iterable[Dict[str, Any]]) -> Dict[str, List[int]]:
+    """Bucket entry indices into specialized datasets for different document categories"""
     
     datasets = {
         'general': [],
@@ -131,14 +228,15 @@ def create_specialized_datasets(entries: List[Dict[str, Any]]) -> Dict[str, List
         'Music Streaming': 'streaming'
     }
     
-    for entry in entries:
+    general = datasets['general']
+    for index, entry in enumerate(entries):
         # Add to general dataset
-        datasets['general'].append(entry)
+        general.append(index)
         
         # Add to specialized dataset if applicable
-        category = entry.get('category', '')
-        if category in category_mapping:
-            datasets[category_mapping[category]].append(entry)
+        specialized = category_mapping.get(entry.get('category', ''))
+        if specialized:
+            datasets[specialized].append(index)
     
     return datasets
 
@@ -148,6 +246,8 @@ def main():
     parser.add_argument('--output-dir', default='../data/lora-training', help='Output directory for prepared data')
     parser.add_argument('--format', choices=['alpaca', 'conversation', 'both'], default='both', 
                        help='Output format for training data')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                       help='Worker processes used to format entries')
     args = parser.parse_args()
     
     # Create output directory
@@ -167,16 +267,8 @@ def main():
     
     print(f"📖 Loading training data from {train_file}")
     
-    train_entries = []
-    with open(train_file, 'r') as f:
-        for line in f:
-            train_entries.append(json.loads(line.strip()))
-    
-    val_entries = []
-    if os.path.exists(val_file):
-        with open(val_file, 'r') as f:
-            for line in f:
-                val_entries.append(json.loads(line.strip()))
+    train_entries = list(iter_jsonl(train_file))
+    val_entries = list(iter_jsonl(val_file)) if os.path.exists(val_file) else []
     
     print(f"✅ Loaded {len(train_entries)} training samples")
     print(f"✅ Loaded {len(val_entries)} validation samples")
@@ -186,52 +278,45 @@ def main():
     train_datasets = create_specialized_datasets(train_entries)
     val_datasets = create_specialized_datasets(val_entries)
     
-    for category, entries in train_datasets.items():
-        if entries:
-            print(f"  - {category}: {len(entries)} samples")
+    for category, indices in train_datasets.items():
+        if indices:
+            print(f"  - {category}: {len(indices)} samples")
+    
+    formats = tuple(FORMATTERS) if args.format == 'both' else (args.format,)
+    render = partial(format_entry, formats=formats)
     
-    # Convert to training formats
-    for dataset_name, train_data in train_datasets.items():
-        if not train_data:
+    # Convert to training formats. Formatting is CPU-bound and independent
+    # per entry, so it is fanned out over a process pool. Every entry is
+    # rendered exactly once, in every requested format at the same time;
+    # the category datasets then just select rows by index.
+    with multiprocessing.Pool(args.workers) as pool:
+        train_rows = pool.map(render, train_entries, chunksize=FORMAT_CHUNKSIZE)
+        val_rows = pool.map(render, val_entries, chunksize=FORMAT_CHUNKSIZE)
+    del train_entries, val_entries
+    
+    for dataset_name, train_indices in train_datasets.items():
+        if not train_indices:
             continue
-            
+        
         print(f"\n🔄 Processing {dataset_name} dataset...")
         
-        # Alpaca format
-        if args.format in ['alpaca', 'both']:
-            alpaca_train = [create_alpaca_format(entry) for entry in train_data]
-            alpaca_val = [create_alpaca_format(entry) for entry in val_datasets.get(dataset_name, [])]
-            
-            # Save Alpaca format
-            alpaca_dir = os.path.join(args.output_dir, 'alpaca', dataset_name)
-            os.makedirs(alpaca_dir, exist_ok=True)
-            
-            with open(os.path.join(alpaca_dir, 'train.json'), 'w') as f:
-                json.dump(alpaca_train, f, indent=2)
-            
-            if alpaca_val:
-                with open(os.path.join(alpaca_dir, 'validation.json'), 'w') as f:
-                    json.dump(alpaca_val, f, indent=2)
-            
-            print(f"  ✅ Saved Alpaca format to {alpaca_dir}")
+        format_dirs = [os.path.join(args.output_dir, name, dataset_name) for name in formats]
+        for format_dir in format_dirs:
+            os.makedirs(format_dir, exist_ok=True)
+        
+        splits = (
+            ('train', train_rows, train_indices),
+            ('validation', val_rows, val_datasets.get(dataset_name, [])),
+        )
+        for split, rows, indices in splits:
+            if indices:
+                write_jsonl_files(
+                    [os.path.join(format_dir, f'{split}.jsonl') for format_dir in format_dirs],
+                    (rows[index] for index in indices)
+                )
         
-        # Conversational format
-        if args.format in ['conversation', 'both']:
-            conv_train = [create_conversational_format(entry) for entry in train_data]
-            conv_val = [create_conversational_format(entry) for entry in val_datasets.get(dataset_name, [])]
-            
-            # Save conversational format
-            conv_dir = os.path.join(args.output_dir, 'conversation', dataset_name)
-            os.makedirs(conv_dir, exist_ok=True)
-            
-            with open(os.path.join(conv_dir, 'train.json'), 'w') as f:
-                json.dump(conv_train, f, indent=2)
-            
-            if conv_val:
-                with open(os.path.join(conv_dir, 'validation.json'), 'w') as f:
-                    json.dump(conv_val, f, indent=2)
-            
-            print(f"  ✅ Saved conversational format to {conv_dir}")
+        for name, format_dir in zip(formats, format_dirs):
+            print(f"  ✅ Saved {FORMAT_LABELS[name]} format to {format_dir}")
     
     # Create training config
     config = {
@@ -254,12 +339,11 @@ def main():
             "evaluation_strategy": "epoch"
         },
         "datasets": {
-            name: len(entries) for name, entries in train_datasets.items() if entries
+            name: len(indices) for name, indices in train_datasets.items() if indices
         }
     }
     
-    with open(os.path.join(args.output_dir, 'training_config.json'), 'w') as f:
-        json.dump(config, f, indent=2)
+    write_json(os.path.join(args.output_dir, 'training_config.json'), config)
     
     print(f"\n✅ Training data preparation complete!")
     print(f"📁 Output directory: {args.output_dir}")
@@ -8,36 +8,133 @@ import os
 import json
 import torch
 from datetime import datetime
+from functools import partial
 from typing import Dict, List, Any
 import argparse
-from datasets import Dataset, DatasetDict
+import pyarrow as pa
+import pyarrow.compute as pc
+from datasets import Dataset, DatasetDict, load_dataset as hf_load_dataset
 from transformers import TrainingArguments
 from trl import SFTTrainer
 from unsloth import FastLanguageModel
 import wandb
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def write_json(path: str, obj: Any) -> None:
+    """Write obj to path as indented JSON"""
+    if orjson is not None:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+    else:
+        with open(path, 'w') as f:
+            json.dump(obj, f, indent=2)
+
+def format_batch(batch: pa.Table) -> pa.Table:
+    """Render a batch of prepared records into training text"""
+    # Built with Arrow compute kernels over whole columns, so no Python
+    # object is created per record or per message
+    if 'messages' in batch.column_names:  # Conversational format
+        messages = batch.column('messages').combine_chunks()
+        flat = messages.flatten()
+        lines = pc.binary_join_element_wise(
+            pc.struct_field(flat, 'role'), pc.struct_field(flat, 'content'), ': '
+        )
+        offsets = pc.subtract(messages.offsets, messages.offsets[0])
+        texts = pc.utf8_trim_whitespace(
+            pc.binary_join(pa.ListArray.from_arrays(offsets, lines), '\n\n')
+        )
+    else:  # Alpaca format
+        input_text = pc.fill_null(batch.column('input'), '')
+        input_section = pc.if_else(
+            pc.equal(input_text, ''),
+            '',
+            pc.binary_join_element_wise('### Input:\n', input_text, '\n\n', '')
+        )
+        texts = pc.binary_join_element_wise(
+            '### Instruction:\n', batch.column('instruction'), '\n\n',
+            input_section,
+            '### Response:\n', batch.column('output'),
+            ''
+        )
+    return pa.table({'text': texts})
+
+def resolve_precision(precision: str) -> str:
+    """Resolve "auto" to bf16 on GPUs that support it (Ampere/Hopper), else fp16"""
+    if precision == "auto":
+        return "bf16" if torch.cuda.is_available() and torch.cuda.is_bf16_supported() else "fp16"
+    return precision
+
+TORCH_DTYPES = {
+    "bf16": torch.bfloat16,
+    "fp16": torch.float16,
+    "fp32": torch.float32,
+}
+
 def load_dataset(data_path: str) -> Dataset:
     """Load and format dataset for training"""
-    with open(data_path, 'r') as f:
-        data = json.load(f)
-    
-    # Format for training
-    formatted_data = []
-    for item in data:
-        if isinstance(item, list):  # Conversational format
-            # Convert to single string
-            conversation = ""
-            for msg in item:
-                conversation += f"{msg['role']}: {msg['content']}\n\n"
-            formatted_data.append({"text": conversation.strip()})
-        else:  # Alpaca format
-            text = f"### Instruction:\n{item['instruction']}\n\n"
-            if item.get('input'):
-                text += f"### Input:\n{item['input']}\n\n"
-            text += f"### Response:\n{item['output']}"
-            formatted_data.append({"text": text})
-    
-    return Dataset.from_list(formatted_data)
+    # pyarrow's JSON reader parses the JSONL file into a memory-mapped
+    # Arrow table instead of building the whole list in Python first
+    dataset = hf_load_dataset('json', data_files=data_path, split='train')
+    return dataset.with_format('arrow').map(
+        format_batch, batched=True, remove_columns=dataset.column_names
+    ).with_format(None)
+
+def tokenize_batch(batch: Dict[str, List[str]], tokenizer, max_seq_length: int) -> Dict[str, List[List[int]]]:
+    """Tokenize a batch of training text, ending every sample with EOS"""
+    # Leave room for the EOS token so packed samples stay separated
+    encoded = tokenizer(batch['text'], truncation=True, max_length=max_seq_length - 1, padding=False)
+    eos_token_id = tokenizer.eos_token_id
+    return {
+        'input_ids': [ids + [eos_token_id] for ids in encoded['input_ids']],
+        'attention_mask': [mask + [1] for mask in encoded['attention_mask']],
+    }
+
+def map_workers(dataset: Dataset) -> int:
+    """Worker processes for a batched map: one per 1000-row batch, up to a core each"""
+    return max(1, min(os.cpu_count() or 1, len(dataset) // 1000))
+
+def tokenize_dataset(dataset: Dataset, tokenizer, max_seq_length: int) -> Dataset:
+    """Tokenize a text dataset once up front into a cached Arrow dataset"""
+    # The result is cached next to the source file, so later epochs and
+    # reruns on the same data read token ids instead of re-tokenizing
+    return dataset.map(
+        partial(tokenize_batch, tokenizer=tokenizer, max_seq_length=max_seq_length),
+        batched=True,
+        batch_size=1000,
+        num_proc=map_workers(dataset),
+        remove_columns=['text'],
+    )
+
+def pack_dataset(dataset: Dataset, max_seq_length: int) -> Dataset:
+    """Concatenate tokenized samples and cut them into max_seq_length blocks"""
+    # One pass over the whole token column, so only the final partial block
+    # is dropped rather than the tail of every map batch or shard. Every
+    # sample already ends with EOS, which separates samples inside a block.
+    ids = pc.list_flatten(dataset.data.column('input_ids')).combine_chunks()
+    total = len(ids) - len(ids) % max_seq_length
+    offsets = pa.array(range(0, total + 1, max_seq_length), type=pa.int32())
+    return Dataset(pa.table({
+        'input_ids': pa.ListArray.from_arrays(offsets, ids.slice(0, total)),
+        'attention_mask': pa.ListArray.from_arrays(
+            offsets, pa.repeat(pa.scalar(1, pa.int8()), total)
+        ),
+    }))
+
+def check_packed(dataset: Dataset, max_seq_length: int) -> None:
+    """Fail early unless every packed sequence is exactly max_seq_length long"""
+    if len(dataset) == 0:
+        raise ValueError(
+            f"Dataset has fewer than {max_seq_length} tokens to pack; train with --no-packing"
+        )
+    lengths = pc.min_max(pc.list_value_length(dataset.data.column('input_ids')))
+    if lengths['min'].as_py() != max_seq_length or lengths['max'].as_py() != max_seq_length:
+        raise ValueError(
+            f"Packed sequences are {lengths['min']}-{lengths['max']} tokens, expected {max_seq_length}"
+        )
 
 def train_lora_model(args):
     """Main training function"""
@@ -53,12 +150,16 @@ def train_lora_model(args):
             config=vars(args)
         )
     
-    # Load model and tokenizer
-    print(f"\n📦 Loading base model: {args.base_model}")
+    # bf16 matches fp16 throughput on Ampere+ but needs no loss scaling
+    precision = resolve_precision(args.precision)
+    
+    # Load model and tokenizer. Unsloth picks the attention kernel itself
+    # (FlashAttention when flash_attn is installed), so none is requested here
+    print(f"\n📦 Loading base model: {args.base_model} ({precision})")
     model, tokenizer = FastLanguageModel.from_pretrained(
         model_name=args.base_model,
         max_seq_length=args.max_seq_length,
-        dtype=torch.float16 if args.use_fp16 else torch.float32,
+        dtype=TORCH_DTYPES[precision],
         load_in_4bit=args.use_4bit,
     )
     
@@ -79,10 +180,10 @@ def train_lora_model(args):
     
     # Load datasets
     print(f"\n📚 Loading training data from {args.data_dir}")
-    train_dataset = load_dataset(os.path.join(args.data_dir, 'train.json'))
+    train_dataset = load_dataset(os.path.join(args.data_dir, 'train.jsonl'))
     val_dataset = None
     
-    val_path = os.path.join(args.data_dir, 'validation.json')
+    val_path = os.path.join(args.data_dir, 'validation.jsonl')
     if os.path.exists(val_path):
         val_dataset = load_dataset(val_path)
         print(f"✅ Loaded {len(train_dataset)} training samples")
@@ -91,6 +192,21 @@ def train_lora_model(args):
         print(f"✅ Loaded {len(train_dataset)} training samples")
         print("⚠️  No validation set found")
     
+    print("\n🔤 Tokenizing datasets")
+    train_dataset = tokenize_dataset(train_dataset, tokenizer, args.max_seq_length)
+    if val_dataset is not None:
+        val_dataset = tokenize_dataset(val_dataset, tokenizer, args.max_seq_length)
+    
+    # Concatenate samples into full max_seq_length sequences instead of
+    # padding each one, so no compute is spent on pad tokens
+    if args.packing:
+        print(f"\n📦 Packing samples into {args.max_seq_length}-token sequences")
+        train_dataset = pack_dataset(train_dataset, args.max_seq_length)
+        check_packed(train_dataset, args.max_seq_length)
+        if val_dataset is not None:
+            val_dataset = pack_dataset(val_dataset, args.max_seq_length)
+            check_packed(val_dataset, args.max_seq_length)
+    
     # Training arguments
     output_dir = os.path.join(args.output_dir, args.model_name)
     training_args = TrainingArguments(
@@ -100,11 +216,15 @@ def train_lora_model(args):
         gradient_accumulation_steps=args.gradient_accumulation_steps,
         warmup_steps=args.warmup_steps,
         learning_rate=args.learning_rate,
-        fp16=args.use_fp16,
+        # Block-wise int8 optimizer state, paged to host memory under pressure
+        optim=args.optim,
+        bf16=precision == "bf16",
+        fp16=precision == "fp16",
         logging_steps=args.logging_steps,
         save_strategy="epoch",
         evaluation_strategy="epoch" if val_dataset else "no",
         save_total_limit=3,
+        save_safetensors=True,
         load_best_model_at_end=True if val_dataset else False,
         report_to="wandb" if args.use_wandb else "none",
         run_name=args.model_name,
@@ -118,9 +238,11 @@ def train_lora_model(args):
         train_dataset=train_dataset,
         eval_dataset=val_dataset,
         args=training_args,
-        dataset_text_field="text",
         max_seq_length=args.max_seq_length,
+        # Datasets are already tokenized (and packed) above, so the trainer
+        # must use them as they are rather than run its own preparation
         packing=False,
+        dataset_kwargs={"skip_prepare_dataset": True},
     )
     
     # Start training
@@ -129,14 +251,11 @@ def train_lora_model(args):
     
     trainer.train()
     
-    # Save final model
+    # Save the LoRA adapter and tokenizer once, at the path test-lora.py and
+    # the deploy scripts load from
     print(f"\n💾 Saving final model")
-    trainer.save_model()
-    
-    # Save LoRA adapter separately
-    lora_dir = os.path.join(output_dir, "lora_adapter")
-    model.save_pretrained(lora_dir)
-    tokenizer.save_pretrained(lora_dir)
+    model.save_pretrained(output_dir, safe_serialization=True)
+    tokenizer.save_pretrained(output_dir)
     
     # Save training metadata
     metadata = {
@@ -145,14 +264,15 @@ def train_lora_model(args):
         "training_completed": datetime.now().isoformat(),
         "num_epochs": args.num_epochs,
         "lora_rank": args.lora_rank,
+        "precision": precision,
+        "packing": args.packing,
         "training_samples": len(train_dataset),
         "validation_samples": len(val_dataset) if val_dataset else 0,
         "final_loss": trainer.state.log_history[-1].get("loss", "N/A"),
         "dataset_type": args.dataset_type
     }
     
-    with open(os.path.join(output_dir, "training_metadata.json"), "w") as f:
-        json.dump(metadata, f, indent=2)
+    write_json(os.path.join(output_dir, "training_metadata.json"), metadata)
     
     print(f"\n✅ Training complete!")
     print(f"📁 Model saved to: {output_dir}")
@@ -176,7 +296,7 @@ def main():
     
     # Data arguments
     parser.add_argument('--data-dir', required=True, 
-                       help='Directory containing train.json and validation.json')
+                       help='Directory containing train.jsonl and validation.jsonl')
     parser.add_argument('--dataset-type', default='general',
                        choices=['general', 'social_media', 'ecommerce', 'financial', 'streaming'],
                        help='Type of dataset being trained on')
@@ -202,12 +322,16 @@ def main():
                        help='Warmup steps')
     parser.add_argument('--logging-steps', type=int, default=25, 
                        help='Logging frequency')
+    parser.add_argument('--optim', default='paged_adamw_8bit',
+                       help='Optimizer passed to TrainingArguments (e.g. paged_adamw_8bit, adamw_torch)')
     
     # Other arguments
     parser.add_argument('--output-dir', default='../models/lora', 
                        help='Output directory for models')
-    parser.add_argument('--use-fp16', action='store_true', 
-                       help='Use FP16 training')
+    parser.add_argument('--precision', choices=['auto', 'bf16', 'fp16', 'fp32'], default='auto',
+                       help='Training precision; auto picks bf16 when the GPU supports it, else fp16')
+    parser.add_argument('--no-packing', dest='packing', action='store_false',
+                       help='Pad each sample separately instead of packing samples into full sequences')
     parser.add_argument('--use-4bit', action='store_true', 
                        help='Use 4-bit quantization')
     parser.add_argument('--use-wandb', action='store_true', 
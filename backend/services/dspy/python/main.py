@@ -4,18 +4,25 @@ Real DSPy framework integration for production prompt optimization
 """
 
 import os
+import json
 import asyncio
 import logging
 from contextlib import asynccontextmanager
-from typing import Dict, List, Optional, Any
+from dataclasses import fields
+from typing import Annotated, Dict, List, Optional, Any
 from datetime import datetime
 
 import dspy
+import msgspec
+import orjson
+import requests
 import uvicorn
-from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from loguru import logger
+from requests.adapters import HTTPAdapter
 
 from optimizers import (
     DSPyOptimizationEngine,
@@ -33,41 +40,164 @@ from evaluators import (
     BusinessMetricEvaluator,
     ConversionRateEvaluator,
     SatisfactionScoreEvaluator,
-    AccuracyEvaluator
+    AccuracyEvaluator,
+    warm_up_jit
 )
 from training_data import TrainingDataManager
 from template_manager import PromptTemplateManager
 from websocket_manager import WebSocketManager
+from single_flight import LegalAnalysisSingleFlight
 
 # Configure logging
 logger.add("logs/dspy_service.log", rotation="1 day", retention="30 days", level="INFO")
 
+# Seconds the health check waits for the LM to answer
+HEALTH_CHECK_TIMEOUT_SECONDS = 10
+
+# Seconds between SSE keep-alive comments while an analysis is running
+SSE_HEARTBEAT_SECONDS = 15
+
+# WebSocket protocol pings: interval, and how long to wait for the pong
+WS_PING_INTERVAL_SECONDS = 30
+WS_PING_TIMEOUT_SECONDS = 20
+
+# Largest dataset an optimization job accepts
+MAX_DATASET_ITEMS = 10000
+
+# Keep-alive connections held open to the LM server
+LM_HTTP_POOL_SIZE = 32
+
 # Global state
 optimization_engine: Optional[DSPyOptimizationEngine] = None
 websocket_manager: Optional[WebSocketManager] = None
 template_manager: Optional[PromptTemplateManager] = None
 training_data_manager: Optional[TrainingDataManager] = None
+legal_analyses: Optional[LegalAnalysisSingleFlight] = None
+lm_http_session: Optional[requests.Session] = None
+
+class SessionOllamaLocal(dspy.OllamaLocal):
+    """OllamaLocal that posts through a shared requests.Session.
+
+    dspy's client calls module-level requests.post, which opens a fresh
+    connection per generation; this one reuses the session's pooled
+    keep-alive connections instead.
+    """
+    
+    def __init__(self, session: requests.Session, **kwargs):
+        super().__init__(**kwargs)
+        self.session = session
+    
+    def basic_request(self, prompt: str, **kwargs):
+        raw_kwargs = kwargs
+        kwargs = {**self.kwargs, **kwargs}
+        
+        settings_dict = {
+            "model": self.model_name,
+            "options": {k: v for k, v in kwargs.items() if k != "n"},
+            "stream": False,
+        }
+        if self.model_type == "chat":
+            settings_dict["messages"] = [{"role": "user", "content": prompt}]
+            url = f"{self.base_url}/api/chat"
+        else:
+            settings_dict["prompt"] = prompt
+            url = f"{self.base_url}/api/generate"
+        if getattr(self, "system", None):
+            settings_dict["system"] = self.system
+        if getattr(self, "format", None):
+            settings_dict["format"] = self.format
+        
+        choices = []
+        completion_tokens = 0
+        for i in range(kwargs["n"]):
+            response = self.session.post(url, json=settings_dict, timeout=self.timeout_s)
+            response.raise_for_status()
+            response_json = response.json()
+            
+            text = (
+                response_json["message"]["content"]
+                if self.model_type == "chat"
+                else response_json["response"]
+            )
+            choices.append({
+                "index": i,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop"
+            })
+            completion_tokens += response_json.get("eval_count", 0)
+        
+        prompt_tokens = response_json.get("prompt_eval_count", 0)
+        request_info = {
+            "model": self.model_name,
+            "created": int(datetime.now().timestamp()),
+            "choices": choices,
+            "additional_kwargs": {k: v for k, v in response_json.items() if k not in ("response", "message")},
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+        
+        self.history.append({
+            "prompt": prompt,
+            "response": request_info,
+            "kwargs": kwargs,
+            "raw_kwargs": raw_kwargs
+        })
+        return request_info
+
+def create_lm(session: requests.Session) -> dspy.LM:
+    """Create the DSPy LM, served by vLLM when VLLM_URL is set, else Ollama"""
+    vllm_url = os.getenv("VLLM_URL")
+    
+    if vllm_url:
+        # vLLM batches in-flight requests into shared GPU passes, so
+        # concurrent endpoint calls no longer queue behind each other
+        default_model = os.getenv("DEFAULT_MODEL", "TheBloke/Mistral-7B-Instruct-v0.2-AWQ")
+        logger.info(f"Using vLLM backend at {vllm_url} with model {default_model}")
+        return dspy.OpenAI(
+            api_base=f"{vllm_url.rstrip('/')}/v1/",
+            api_key=os.getenv("VLLM_API_KEY", "EMPTY"),
+            model=default_model,
+            model_type="text",
+            max_tokens=4096,
+            temperature=0.1
+        )
+    
+    ollama_url = os.getenv("OLLAMA_URL", "http://localhost:11434")
+    default_model = os.getenv("DEFAULT_MODEL", "mistral:7b-instruct-q4_K_M")
+    logger.info(f"Using Ollama backend at {ollama_url} with model {default_model}")
+    return SessionOllamaLocal(
+        session=session,
+        base_url=ollama_url,
+        model=default_model,
+        max_tokens=4096,
+        temperature=0.1
+    )
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Initialize and cleanup DSPy service"""
-    global optimization_engine, websocket_manager, template_manager, training_data_manager
+    global optimization_engine, websocket_manager, template_manager, training_data_manager, legal_analyses
+    global lm_http_session
     
     try:
         logger.info("Initializing Fine Print AI DSPy Service")
         
-        # Configure DSPy with Ollama
-        ollama_url = os.getenv("OLLAMA_URL", "http://localhost:11434")
-        default_model = os.getenv("DEFAULT_MODEL", "mistral:7b")
+        # One session shared by every Ollama LM, so LM calls reuse pooled
+        # keep-alive connections instead of opening one per generation
+        lm_http_session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LM_HTTP_POOL_SIZE)
+        lm_http_session.mount("http://", adapter)
+        lm_http_session.mount("https://", adapter)
         
-        # Initialize DSPy LM
-        lm = dspy.OllamaLocal(
-            base_url=ollama_url,
-            model=default_model,
-            max_tokens=4096,
-            temperature=0.1
-        )
-        dspy.settings.configure(lm=lm)
+        # Initialize a pool of DSPy LMs, one per generation the LM server
+        # runs in parallel. The first is also the process-wide default used
+        # by the health check and optimization jobs.
+        lm_pool_size = int(os.getenv("LM_POOL_SIZE", os.getenv("OLLAMA_NUM_PARALLEL", "4")))
+        lm_pool = [create_lm(lm_http_session) for _ in range(max(lm_pool_size, 1))]
+        dspy.settings.configure(lm=lm_pool[0])
         
         # Initialize services
         websocket_manager = WebSocketManager()
@@ -76,12 +206,19 @@ async def lifespan(app: FastAPI):
         optimization_engine = DSPyOptimizationEngine(
             websocket_manager=websocket_manager,
             template_manager=template_manager,
-            training_data_manager=training_data_manager
+            training_data_manager=training_data_manager,
+            lm_pool=lm_pool
         )
         
         # Initialize business modules
         await optimization_engine.initialize_modules()
         
+        # Compile evaluator kernels before the first optimization job needs them
+        await asyncio.to_thread(warm_up_jit)
+        
+        # Identical concurrent legal analyses share one run
+        legal_analyses = LegalAnalysisSingleFlight(optimization_engine)
+        
         logger.info("DSPy Service initialized successfully")
         
         yield
@@ -93,13 +230,16 @@ async def lifespan(app: FastAPI):
         logger.info("Shutting down DSPy Service")
         if optimization_engine:
             await optimization_engine.cleanup()
+        if lm_http_session:
+            lm_http_session.close()
 
 # Create FastAPI app
 app = FastAPI(
     title="Fine Print AI DSPy Service",
     description="Production DSPy framework integration for business optimization",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -114,9 +254,9 @@ app.add_middleware(
 # Pydantic Models
 class LegalAnalysisRequest(BaseModel):
     document_content: str = Field(..., min_length=1, max_length=100000)
-    document_type: str = Field(..., regex="^(terms_of_service|privacy_policy|eula|license)$")
+    document_type: str = Field(..., pattern="^(terms_of_service|privacy_policy|eula|license)$")
     language: str = Field(default="en", max_length=10)
-    analysis_depth: str = Field(default="detailed", regex="^(basic|detailed|comprehensive)$")
+    analysis_depth: str = Field(default="detailed", pattern="^(basic|detailed|comprehensive)$")
     optimization_version: Optional[str] = None
 
 class LegalAnalysisResponse(BaseModel):
@@ -130,7 +270,7 @@ class LegalAnalysisResponse(BaseModel):
 class OptimizationStartRequest(BaseModel):
     module_name: str = Field(..., min_length=1)
     config: Dict[str, Any]
-    dataset: List[Dict[str, Any]] = Field(..., min_items=1, max_items=10000)
+    dataset: List[Dict[str, Any]] = Field(..., min_length=1, max_length=MAX_DATASET_ITEMS)
 
 class OptimizationStatusResponse(BaseModel):
     job_id: str
@@ -142,13 +282,51 @@ class OptimizationStatusResponse(BaseModel):
     results: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
 
+# msgspec mirrors of the large request bodies. Endpoints decode and validate
+# these straight from the raw body, which is several times faster than
+# pydantic for 100k-character documents and 10k-item datasets; the pydantic
+# models above still describe the bodies in the OpenAPI schema.
+class LegalAnalysisPayload(msgspec.Struct):
+    document_content: Annotated[str, msgspec.Meta(min_length=1, max_length=100000)]
+    document_type: Annotated[str, msgspec.Meta(pattern="^(terms_of_service|privacy_policy|eula|license)$")]
+    language: Annotated[str, msgspec.Meta(max_length=10)] = "en"
+    analysis_depth: Annotated[str, msgspec.Meta(pattern="^(basic|detailed|comprehensive)$")] = "detailed"
+    optimization_version: Optional[str] = None
+
+class OptimizationStartPayload(msgspec.Struct):
+    module_name: Annotated[str, msgspec.Meta(min_length=1)]
+    config: Dict[str, Any]
+    dataset: Annotated[List[Dict[str, Any]], msgspec.Meta(min_length=1, max_length=MAX_DATASET_ITEMS)]
+
+async def decode_body(request: Request, payload_type: type) -> Any:
+    """Decode and validate a JSON request body with msgspec"""
+    try:
+        return msgspec.json.decode(await request.body(), type=payload_type)
+    except msgspec.ValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except msgspec.DecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+
+def body_schema(model: type) -> Dict[str, Any]:
+    """OpenAPI requestBody for endpoints that read their body with decode_body"""
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": model.model_json_schema()}}
+        }
+    }
+
 # Health Check
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     try:
-        # Test DSPy connection
-        test_response = dspy.settings.lm("Test connection")
+        # Test DSPy connection. The LM call blocks, so it runs in a worker
+        # thread and is bounded so a stalled LM server fails the check quickly.
+        test_response = await asyncio.wait_for(
+            asyncio.to_thread(dspy.settings.lm, "Test connection"),
+            timeout=HEALTH_CHECK_TIMEOUT_SECONDS
+        )
         
         return {
             "status": "healthy",
@@ -166,16 +344,22 @@ async def health_check():
         }
 
 # Legal Document Analysis
-@app.post("/analyze/legal", response_model=LegalAnalysisResponse)
-async def analyze_legal_document(request: LegalAnalysisRequest):
+@app.post(
+    "/analyze/legal",
+    response_model=LegalAnalysisResponse,
+    openapi_extra=body_schema(LegalAnalysisRequest)
+)
+async def analyze_legal_document(http_request: Request):
     """Analyze legal document using optimized DSPy modules"""
-    if not optimization_engine:
+    if not optimization_engine or not legal_analyses:
         raise HTTPException(status_code=500, detail="Optimization engine not initialized")
     
+    request = await decode_body(http_request, LegalAnalysisPayload)
+    
     try:
         logger.info(f"Starting legal analysis: {request.document_type}, depth: {request.analysis_depth}")
         
-        result = await optimization_engine.analyze_legal_document(
+        result = await legal_analyses.analyze(
             document_content=request.document_content,
             document_type=request.document_type,
             language=request.language,
@@ -183,12 +367,83 @@ async def analyze_legal_document(request: LegalAnalysisRequest):
             optimization_version=request.optimization_version
         )
         
-        return LegalAnalysisResponse(**result)
+        # Validated once, against response_model, on the way out
+        return result
         
     except Exception as e:
         logger.error(f"Legal analysis failed: {e}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+def _sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/analyze/legal/stream", openapi_extra=body_schema(LegalAnalysisRequest))
+async def analyze_legal_document_stream(http_request: Request):
+    """Analyze legal document, streaming progress and results as Server-Sent Events.
+    
+    The client gets a "started" event immediately and keep-alive comments
+    while the analysis runs. The result then arrives section by section:
+    summary, key_findings, recommendations, findings, and a final "done"
+    event carrying the DSPy metadata.
+    """
+    if not optimization_engine or not legal_analyses:
+        raise HTTPException(status_code=500, detail="Optimization engine not initialized")
+    
+    request = await decode_body(http_request, LegalAnalysisPayload)
+    
+    logger.info(f"Starting streamed legal analysis: {request.document_type}, depth: {request.analysis_depth}")
+    
+    async def event_stream():
+        analysis = asyncio.create_task(legal_analyses.analyze(
+            document_content=request.document_content,
+            document_type=request.document_type,
+            language=request.language,
+            analysis_depth=request.analysis_depth,
+            optimization_version=request.optimization_version
+        ))
+        
+        try:
+            yield _sse_event("started", {
+                "document_type": request.document_type,
+                "analysis_depth": request.analysis_depth,
+                "timestamp": datetime.utcnow().isoformat()
+            })
+            
+            # Keep proxies from timing out the connection during long analyses
+            while True:
+                done, _ = await asyncio.wait({analysis}, timeout=SSE_HEARTBEAT_SECONDS)
+                if done:
+                    break
+                yield ": keep-alive\n\n"
+            
+            try:
+                result = LegalAnalysisResponse(**analysis.result())
+            except Exception as e:
+                logger.error(f"Streamed legal analysis failed: {e}")
+                yield _sse_event("error", {"detail": f"Analysis failed: {str(e)}"})
+                return
+            
+            yield _sse_event("summary", {
+                "risk_score": result.risk_score,
+                "executive_summary": result.executive_summary
+            })
+            yield _sse_event("key_findings", result.key_findings)
+            yield _sse_event("recommendations", result.recommendations)
+            yield _sse_event("findings", result.findings)
+            yield _sse_event("done", {"dspy_metadata": result.dspy_metadata})
+            
+        finally:
+            # The client may disconnect before the analysis finishes; the
+            # analysis stops unless another request is waiting on it
+            analysis.cancel()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Business Content Optimization
 @app.post("/optimize/marketing-content")
 async def optimize_marketing_content(
@@ -266,12 +521,14 @@ async def optimize_support_response(
         raise HTTPException(status_code=500, detail=f"Optimization failed: {str(e)}")
 
 # Module Optimization Management
-@app.post("/optimization/start")
-async def start_optimization(request: OptimizationStartRequest, background_tasks: BackgroundTasks):
+@app.post("/optimization/start", openapi_extra=body_schema(OptimizationStartRequest))
+async def start_optimization(http_request: Request, background_tasks: BackgroundTasks):
     """Start DSPy module optimization job"""
     if not optimization_engine:
         raise HTTPException(status_code=500, detail="Optimization engine not initialized")
     
+    request = await decode_body(http_request, OptimizationStartPayload)
+    
     try:
         job_id = await optimization_engine.start_optimization(
             module_name=request.module_name,
@@ -289,6 +546,73 @@ async def start_optimization(request: OptimizationStartRequest, background_tasks
         logger.error(f"Failed to start optimization: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to start optimization: {str(e)}")
 
+@app.post("/optimization/start-stream")
+async def start_optimization_stream(request: Request):
+    """Start DSPy module optimization job from an NDJSON body.
+    
+    The first line is {"module_name": ..., "config": {...}}, and every
+    following line is one dataset item. Lines are parsed as they arrive,
+    so the raw body is never buffered whole, and a malformed or oversized
+    upload is rejected at the offending line.
+    """
+    if not optimization_engine:
+        raise HTTPException(status_code=500, detail="Optimization engine not initialized")
+    
+    header: Optional[Dict[str, Any]] = None
+    dataset: List[Dict[str, Any]] = []
+    line_number = 0
+    
+    def ingest(line: bytes):
+        nonlocal header, line_number
+        line_number += 1
+        if not line.strip():
+            return
+        
+        try:
+            item = orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON on line {line_number}: {e}")
+        if not isinstance(item, dict):
+            raise HTTPException(status_code=400, detail=f"Line {line_number} is not a JSON object")
+        
+        if header is None:
+            header = item
+        elif len(dataset) >= MAX_DATASET_ITEMS:
+            raise HTTPException(status_code=413, detail=f"Dataset exceeds {MAX_DATASET_ITEMS} items")
+        else:
+            dataset.append(item)
+    
+    pending = b""
+    async for chunk in request.stream():
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            ingest(line)
+    ingest(pending)
+    
+    if header is None or not header.get("module_name"):
+        raise HTTPException(status_code=400, detail="First line must give module_name and config")
+    if not dataset:
+        raise HTTPException(status_code=400, detail="Dataset must contain at least one item")
+    
+    try:
+        job_id = await optimization_engine.start_optimization(
+            module_name=header["module_name"],
+            config=OptimizationConfig(**header.get("config", {})),
+            dataset=dataset
+        )
+        
+        return {
+            "job_id": job_id,
+            "message": f"Optimization started for module '{header['module_name']}'",
+            "status": "started",
+            "dataset_size": len(dataset)
+        }
+        
+    except Exception as e:
+        logger.error(f"Failed to start optimization: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to start optimization: {str(e)}")
+
 @app.get("/optimization/jobs/{job_id}", response_model=OptimizationStatusResponse)
 async def get_optimization_status(job_id: str):
     """Get optimization job status"""
@@ -300,14 +624,23 @@ async def get_optimization_status(job_id: str):
         if not job:
             raise HTTPException(status_code=404, detail="Optimization job not found")
         
+        # The compiled module is a live DSPy program, not response data
+        results = None
+        if job.results:
+            results = {
+                field.name: getattr(job.results, field.name)
+                for field in fields(job.results)
+                if field.name != "compiled_module"
+            }
+        
         return OptimizationStatusResponse(
             job_id=job.id,
-            status=job.status,
+            status=job.status.value,
             progress=job.progress,
             message=job.message or "",
             started_at=job.started_at,
             completed_at=job.completed_at,
-            results=job.results.dict() if job.results else None,
+            results=results,
             error=job.error_message
         )
         
@@ -432,16 +765,12 @@ async def websocket_optimization_progress(websocket: WebSocket, job_id: str):
     try:
         await websocket_manager.add_client(job_id, websocket)
         
-        # Keep connection alive
+        # Keepalive pings are handled by the server protocol (ws_ping_interval);
+        # the handler only waits here to notice the client disconnecting
         while True:
-            try:
-                # Ping client to keep connection alive
-                await websocket.ping()
-                await asyncio.sleep(30)  # Ping every 30 seconds
-            except WebSocketDisconnect:
-                break
-            except Exception as e:
-                logger.error(f"WebSocket error for job {job_id}: {e}")
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                logger.info(f"WebSocket disconnected for job {job_id}")
                 break
                 
     except WebSocketDisconnect:
@@ -482,10 +811,20 @@ async def list_modules():
         raise HTTPException(status_code=500, detail=f"Failed to list modules: {str(e)}")
 
 if __name__ == "__main__":
+    dev_mode = bool(os.getenv("DEV"))
+    
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8007,
-        reload=True,
+        reload=dev_mode,
+        # Optimization jobs and WebSocket subscribers live in each worker's
+        # memory, so a job is only visible to the worker that started it.
+        # Keep one worker unless that is acceptable.
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        loop="uvloop",
+        http="httptools",
+        ws_ping_interval=WS_PING_INTERVAL_SECONDS,
+        ws_ping_timeout=WS_PING_TIMEOUT_SECONDS,
         log_level="info"
     )
\ No newline at end of file
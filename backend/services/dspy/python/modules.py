@@ -3,19 +3,26 @@ DSPy Business Modules
 Real DSPy module implementations for Fine Print AI business operations
 """
 
+import re
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
 import dspy
 from loguru import logger
 
+# Patterns for parsing LM output, compiled once at import
+_NUMBER_RE = re.compile(r'\d+\.?\d*')
+_PERCENTAGE_RE = re.compile(r'(\w+).*?(\d+\.?\d*)%')
+
 # DSPy Signatures for Fine Print AI Business Operations
 
 class LegalAnalysisSignature(dspy.Signature):
     """Analyze legal document and identify problematic clauses"""
-    document_content = dspy.InputField(desc="Legal document content to analyze")
+    # Low-cardinality inputs render before the document so requests of the
+    # same type and depth share the longest possible prompt prefix
     document_type = dspy.InputField(desc="Type of legal document (terms_of_service, privacy_policy, eula, license)")
     language = dspy.InputField(desc="Document language code", default="en")
     analysis_depth = dspy.InputField(desc="Analysis depth level (basic, detailed, comprehensive)", default="detailed")
+    document_content = dspy.InputField(desc="Legal document content to analyze")
     
     risk_score = dspy.OutputField(desc="Overall risk score from 0-100")
     executive_summary = dspy.OutputField(desc="Brief executive summary of main concerns")
@@ -152,11 +159,10 @@ class LegalAnalysisModule(dspy.Module):
     def _parse_risk_score(self, risk_score_text: str) -> float:
         """Parse risk score from text output"""
         try:
-            import re
             # Extract number from text
-            matches = re.findall(r'\d+\.?\d*', str(risk_score_text))
-            if matches:
-                score = float(matches[0])
+            match = _NUMBER_RE.search(str(risk_score_text))
+            if match:
+                score = float(match.group())
                 return max(0.0, min(100.0, score))
             return 50.0
         except:
@@ -273,11 +279,10 @@ class MarketingContentModule(dspy.Module):
     def _parse_performance_metrics(self, metrics_text: str) -> Dict[str, Any]:
         """Parse predicted performance metrics"""
         try:
-            import re
             metrics = {}
             
             # Extract percentage values
-            percentages = re.findall(r'(\w+).*?(\d+\.?\d*)%', str(metrics_text))
+            percentages = _PERCENTAGE_RE.findall(str(metrics_text))
             for metric, value in percentages:
                 metrics[metric.lower()] = float(value) / 100
             
@@ -462,10 +467,9 @@ class ComprehensiveLegalAnalysisModule(dspy.Module):
     def _parse_risk_score(self, risk_score_text: str) -> float:
         """Parse risk score from text"""
         try:
-            import re
-            matches = re.findall(r'\d+\.?\d*', str(risk_score_text))
-            if matches:
-                return max(0.0, min(100.0, float(matches[0])))
+            match = _NUMBER_RE.search(str(risk_score_text))
+            if match:
+                return max(0.0, min(100.0, float(match.group())))
             return 50.0
         except:
             return 50.0
@@ -4,9 +4,13 @@ Real DSPy framework integration for systematic prompt optimization
 """
 
 import asyncio
+import os
+import sqlite3
 import uuid
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, List, Optional, Any, Callable
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Callable, Tuple
 from dataclasses import dataclass, asdict
 from enum import Enum
 
@@ -27,6 +31,17 @@ from evaluators import (
     AccuracyEvaluator
 )
 
+# Compiled programs kept in memory per (module_name, optimization_version)
+PROGRAM_CACHE_SIZE = 32
+
+# Module classes by registry name, used to rebuild programs saved to disk
+MODULE_CLASSES = {
+    "legal_analysis": LegalAnalysisModule,
+    "marketing_content": MarketingContentModule,
+    "sales_optimization": SalesOptimizationModule,
+    "support_response": SupportResponseModule
+}
+
 class OptimizationStatus(Enum):
     PENDING = "pending"
     RUNNING = "running"
@@ -42,6 +57,14 @@ class OptimizerType(Enum):
 
 @dataclass
 class OptimizationConfig:
+    """Settings for one optimization job.
+    
+    Jobs compile against the service LM, which defaults to a 4-bit model
+    (DEFAULT_MODEL=mistral:7b-instruct-q4_K_M, or an AWQ model under vLLM).
+    Quantized weights take about a quarter of the memory, leaving room for
+    more concurrent requests at a small cost in accuracy. Point
+    DEFAULT_MODEL at an fp16 tag when accuracy matters more than latency.
+    """
     optimizer_type: OptimizerType
     max_bootstrapped_demos: int = 4
     max_labeled_demos: int = 16
@@ -85,17 +108,47 @@ class DSPyOptimizationEngine:
         self,
         websocket_manager=None,
         template_manager=None,
-        training_data_manager=None
+        training_data_manager=None,
+        program_store_path: str = os.getenv("DSPY_PROGRAM_STORE", "./cache"),
+        lm_pool: Optional[List[Any]] = None
     ):
         self.websocket_manager = websocket_manager
         self.template_manager = template_manager
         self.training_data_manager = training_data_manager
         
+        # LMs free for a module run to check out. Each run uses its own LM
+        # through dspy.context, and runs beyond the pool size wait here
+        # instead of piling onto the LM server.
+        self.lm_pool: List[Any] = list(lm_pool or [])
+        self.idle_lms: "asyncio.Queue[Any]" = asyncio.Queue()
+        for lm in self.lm_pool:
+            self.idle_lms.put_nowait(lm)
+        
         # Module registry
         self.modules: Dict[str, Any] = {}
         
-        # Job tracking
+        # Compiled programs saved by finished optimization jobs, and the ones
+        # loaded from there by (module_name, version) -> (mtime, program)
+        self.program_store = Path(program_store_path)
+        self.program_store.mkdir(parents=True, exist_ok=True)
+        self.program_cache: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        
+        # Job tracking. Jobs live in the dict; an in-memory SQLite table
+        # indexes them by status and module so listing and counting don't
+        # scan every job ever run.
         self.optimization_jobs: Dict[str, OptimizationJob] = {}
+        self.job_index = sqlite3.connect(":memory:")
+        self.job_index.executescript("""
+            CREATE TABLE jobs (
+                id TEXT PRIMARY KEY,
+                module_name TEXT NOT NULL,
+                status TEXT NOT NULL,
+                started_at TEXT NOT NULL
+            );
+            CREATE INDEX jobs_by_status ON jobs (status, started_at);
+            CREATE INDEX jobs_by_module ON jobs (module_name, status, started_at);
+            CREATE INDEX jobs_by_start ON jobs (started_at);
+        """)
         
         # Evaluators
         self.evaluators = {
@@ -110,17 +163,12 @@ class DSPyOptimizationEngine:
     async def initialize_modules(self):
         """Initialize business-specific DSPy modules"""
         try:
-            # Legal Analysis Module
-            self.modules["legal_analysis"] = LegalAnalysisModule()
-            
-            # Marketing Content Module
-            self.modules["marketing_content"] = MarketingContentModule()
-            
-            # Sales Optimization Module
-            self.modules["sales_optimization"] = SalesOptimizationModule()
-            
-            # Support Response Module
-            self.modules["support_response"] = SupportResponseModule()
+            # Start from the latest saved optimization of each module, so
+            # compiled programs survive restarts without recompiling
+            for module_name, module_class in MODULE_CLASSES.items():
+                self.modules[module_name] = (
+                    self._get_program(module_name, "latest") or module_class()
+                )
             
             logger.info(f"Initialized {len(self.modules)} DSPy modules")
             
@@ -143,8 +191,8 @@ class DSPyOptimizationEngine:
                 raise ValueError("Legal analysis module not initialized")
 
             # Use specific optimization version if requested
-            if optimization_version and hasattr(module, 'load_optimization_version'):
-                module.load_optimization_version(optimization_version)
+            if optimization_version:
+                module = self._get_program("legal_analysis", optimization_version) or module
 
             # Create input
             input_data = {
@@ -156,7 +204,7 @@ class DSPyOptimizationEngine:
 
             # Execute analysis
             start_time = datetime.utcnow()
-            result = module.forward(**input_data)
+            result = await self._run_module(module, input_data)
             execution_time = (datetime.utcnow() - start_time).total_seconds() * 1000
 
             # Add metadata
@@ -197,7 +245,7 @@ class DSPyOptimizationEngine:
                 "optimization_goals": optimization_goals
             }
 
-            result = module.forward(**input_data)
+            result = await self._run_module(module, input_data)
             return asdict(result)
 
         except Exception as e:
@@ -224,7 +272,7 @@ class DSPyOptimizationEngine:
                 "conversion_goals": conversion_goals
             }
 
-            result = module.forward(**input_data)
+            result = await self._run_module(module, input_data)
             return asdict(result)
 
         except Exception as e:
@@ -251,13 +299,86 @@ class DSPyOptimizationEngine:
                 "satisfaction_goals": satisfaction_goals
             }
 
-            result = module.forward(**input_data)
+            result = await self._run_module(module, input_data)
             return asdict(result)
 
         except Exception as e:
             logger.error(f"Support response optimization failed: {e}")
             raise
 
+    def _program_path(self, module_name: str, version: str) -> Path:
+        """Path of a compiled program in the on-disk store"""
+        return self.program_store / f"{module_name}-{version}.json"
+
+    def _get_program(self, module_name: str, version: str) -> Optional[Any]:
+        """Get a compiled program saved by an optimization job, or None.
+        
+        Loaded programs are kept in an LRU and reused while their file is
+        unchanged, so every request for a version shares one program whose
+        rendered instructions and demos stay byte-identical (and hit the LM
+        server's prefix cache). A newer file, such as a re-saved "latest",
+        is picked up on the next request.
+        """
+        # Versions come from requests; never let one point outside the store
+        if Path(version).name != version:
+            logger.warning(f"Invalid optimization version {version!r}")
+            return None
+
+        path = self._program_path(module_name, version)
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            if version != "latest":
+                logger.warning(f"No saved program for {module_name} version {version}")
+            return None
+
+        key = (module_name, version)
+        cached = self.program_cache.get(key)
+        if cached is not None and cached[0] == mtime:
+            self.program_cache.move_to_end(key)
+            return cached[1]
+
+        # "latest" links to a versioned file; report the real version
+        program = MODULE_CLASSES[module_name]()
+        program.load(str(path))
+        program.optimization_version = path.resolve().stem[len(module_name) + 1:]
+
+        self.program_cache[key] = (mtime, program)
+        if len(self.program_cache) > PROGRAM_CACHE_SIZE:
+            self.program_cache.popitem(last=False)
+
+        logger.info(f"Loaded compiled program {path.name}")
+        return program
+
+    async def _run_module(self, module: Any, input_data: Dict[str, Any]) -> Any:
+        """Run a module's forward pass in a worker thread.
+        
+        DSPy LM calls are blocking HTTP requests; running them off the event
+        loop keeps the service responsive and lets concurrent requests
+        overlap their generations (up to Ollama's OLLAMA_NUM_PARALLEL).
+        """
+        if not self.lm_pool:
+            return await asyncio.to_thread(module.forward, **input_data)
+
+        lm = await self.idle_lms.get()
+        forward = asyncio.ensure_future(
+            asyncio.to_thread(self._forward_with_lm, module, lm, input_data)
+        )
+        # A cancelled caller cannot stop the worker thread, so the LM only
+        # goes back to the pool once the thread is done with it
+        forward.add_done_callback(lambda _: self.idle_lms.put_nowait(lm))
+        return await asyncio.shield(forward)
+
+    @staticmethod
+    def _forward_with_lm(module: Any, lm: Any, input_data: Dict[str, Any]) -> Any:
+        """Run a module's forward pass against a specific LM.
+        
+        dspy.context is per thread, so it is entered in the worker thread
+        that runs the module and only affects this call.
+        """
+        with dspy.context(lm=lm):
+            return module.forward(**input_data)
+
     async def start_optimization(
         self,
         module_name: str,
@@ -283,6 +404,10 @@ class DSPyOptimizationEngine:
             )
 
             self.optimization_jobs[job_id] = job
+            self.job_index.execute(
+                "INSERT INTO jobs (id, module_name, status, started_at) VALUES (?, ?, ?, ?)",
+                (job_id, module_name, job.status.value, job.started_at.isoformat())
+            )
 
             # Start optimization in background
             asyncio.create_task(self._run_optimization(job, module, dataset))
@@ -302,12 +427,15 @@ class DSPyOptimizationEngine:
     ):
         """Run DSPy optimization process"""
         try:
-            job.status = OptimizationStatus.RUNNING
+            self._set_job_status(job, OptimizationStatus.RUNNING)
             job.message = "Initializing optimization"
             await self._notify_progress(job.id, 5, "Preparing dataset")
 
             # Prepare training and validation datasets
-            train_dataset, val_dataset = self._split_dataset(dataset, split_ratio=0.8)
+            # Building thousands of Examples is CPU work; keep it off the loop
+            train_dataset, val_dataset = await asyncio.to_thread(
+                self._split_dataset, dataset, split_ratio=0.8
+            )
             
             await self._notify_progress(job.id, 10, "Dataset prepared")
 
@@ -330,8 +458,9 @@ class DSPyOptimizationEngine:
             start_time = datetime.utcnow()
             optimization_history = []
 
-            # Compile module with DSPy
-            compiled_module = optimizer.compile(
+            # Compile module with DSPy (off the event loop; it makes many LM calls)
+            compiled_module = await asyncio.to_thread(
+                optimizer.compile,
                 module,
                 trainset=train_dataset,
                 valset=val_dataset,
@@ -362,7 +491,7 @@ class DSPyOptimizationEngine:
             )
 
             # Update job
-            job.status = OptimizationStatus.COMPLETED
+            self._set_job_status(job, OptimizationStatus.COMPLETED)
             job.progress = 100.0
             job.message = f"Optimization completed with {improvement:.2f}% improvement"
             job.completed_at = datetime.utcnow()
@@ -370,7 +499,7 @@ class DSPyOptimizationEngine:
 
             # Save optimized module if improvement is significant
             if improvement > 5.0:  # 5% minimum improvement threshold
-                await self._save_optimized_module(job.module_name, compiled_module, results)
+                await self._save_optimized_module(job.module_name, compiled_module, results, version=job.id)
 
             await self._notify_progress(job.id, 100, f"Completed with {improvement:.2f}% improvement")
 
@@ -378,7 +507,7 @@ class DSPyOptimizationEngine:
 
         except Exception as e:
             logger.error(f"Optimization job {job.id} failed: {e}")
-            job.status = OptimizationStatus.FAILED
+            self._set_job_status(job, OptimizationStatus.FAILED)
             job.error_message = str(e)
             job.completed_at = datetime.utcnow()
             await self._notify_progress(job.id, job.progress, f"Failed: {str(e)}")
@@ -437,25 +566,59 @@ class DSPyOptimizationEngine:
     async def _evaluate_module(self, module: Any, dataset: List[Any], evaluator) -> float:
         """Evaluate module performance on dataset"""
         try:
-            scores = []
-            for example in dataset:
-                try:
-                    prediction = module(**example.inputs())
-                    score = evaluator.evaluate(example, prediction)
-                    scores.append(score)
-                except Exception as e:
-                    logger.warning(f"Evaluation failed for example: {e}")
-                    scores.append(0.0)
+            if not dataset:
+                return 0.0
+            
+            # Predictions are blocking LM calls, so they run in a worker thread
+            examples, predictions = await asyncio.to_thread(self._predict_all, module, dataset)
             
-            return sum(scores) / len(scores) if scores else 0.0
+            # Score every successful prediction in one batch
+            scores = evaluator.evaluate_batch(examples, predictions)
+            return float(scores.sum()) / len(dataset)
             
         except Exception as e:
             logger.error(f"Module evaluation failed: {e}")
             return 0.0
 
-    async def _save_optimized_module(self, module_name: str, compiled_module: Any, results: OptimizationResults):
+    def _predict_all(self, module: Any, dataset: List[Any]):
+        """Run module over dataset, returning the examples that succeeded and their predictions"""
+        examples = []
+        predictions = []
+        for example in dataset:
+            try:
+                predictions.append(module(**example.inputs()))
+                examples.append(example)
+            except Exception as e:
+                # Failed predictions count as 0.0 in the average
+                logger.warning(f"Evaluation failed for example: {e}")
+        return examples, predictions
+
+    async def _save_optimized_module(
+        self,
+        module_name: str,
+        compiled_module: Any,
+        results: OptimizationResults,
+        version: Optional[str] = None
+    ):
         """Save optimized module for future use"""
         try:
+            # Persist the compiled program (instructions and demos) under its
+            # version and point the module's "latest" at it, so later
+            # requests and restarts load it instead of recompiling
+            if version and module_name in MODULE_CLASSES:
+                compiled_module.optimization_version = version
+                path = self._program_path(module_name, version)
+                await asyncio.to_thread(compiled_module.save, str(path))
+                
+                latest = self._program_path(module_name, "latest")
+                staged = latest.with_suffix(".tmp")
+                staged.unlink(missing_ok=True)
+                staged.symlink_to(path.name)
+                staged.replace(latest)
+                
+                # Serve the new program right away, as a restart would
+                self.modules[module_name] = compiled_module
+            
             if self.template_manager:
                 await self.template_manager.save_optimized_module(
                     module_name=module_name,
@@ -491,28 +654,45 @@ class DSPyOptimizationEngine:
         """Get optimization job by ID"""
         return self.optimization_jobs.get(job_id)
 
-    def list_optimization_jobs(
+    def _set_job_status(self, job: OptimizationJob, status: OptimizationStatus):
+        """Change a job's status, keeping the job index in step"""
+        job.status = status
+        self.job_index.execute("UPDATE jobs SET status = ? WHERE id = ?", (status.value, job.id))
+
+    def _query_jobs(
         self,
         status: Optional[str] = None,
         module_name: Optional[str] = None,
-        limit: int = 50,
+        limit: int = -1,
         offset: int = 0
     ) -> List[OptimizationJob]:
-        """List optimization jobs with filtering"""
-        jobs = list(self.optimization_jobs.values())
-        
-        # Apply filters
+        """Select jobs from the index, newest first"""
+        conditions = []
+        params: List[Any] = []
         if status:
-            jobs = [job for job in jobs if job.status.value == status]
-        
+            conditions.append("status = ?")
+            params.append(status)
         if module_name:
-            jobs = [job for job in jobs if job.module_name == module_name]
+            conditions.append("module_name = ?")
+            params.append(module_name)
         
-        # Sort by start time (newest first)
-        jobs.sort(key=lambda job: job.started_at or datetime.min, reverse=True)
-        
-        # Apply pagination
-        return jobs[offset:offset + limit]
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.job_index.execute(
+            f"SELECT id FROM jobs {where} ORDER BY started_at DESC LIMIT ? OFFSET ?",
+            (*params, limit, offset)
+        )
+        return [self.optimization_jobs[job_id] for (job_id,) in rows]
+
+    def list_optimization_jobs(
+        self,
+        status: Optional[str] = None,
+        module_name: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0
+    ) -> List[OptimizationJob]:
+        """List optimization jobs with filtering"""
+        # Filtered, sorted (newest first) and paginated by the index
+        return self._query_jobs(status=status, module_name=module_name, limit=limit, offset=offset)
 
     def list_modules(self) -> List[Dict[str, Any]]:
         """List available DSPy modules"""
@@ -529,13 +709,16 @@ class DSPyOptimizationEngine:
     def get_optimization_metrics(self) -> Dict[str, Any]:
         """Get optimization performance metrics"""
         jobs = list(self.optimization_jobs.values())
-        completed_jobs = [job for job in jobs if job.status == OptimizationStatus.COMPLETED]
+        completed_jobs = self._query_jobs(status=OptimizationStatus.COMPLETED.value)
+        status_counts = dict(
+            self.job_index.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        )
         
         return {
             "total_jobs": len(jobs),
             "completed_jobs": len(completed_jobs),
-            "failed_jobs": len([job for job in jobs if job.status == OptimizationStatus.FAILED]),
-            "running_jobs": len([job for job in jobs if job.status == OptimizationStatus.RUNNING]),
+            "failed_jobs": status_counts.get(OptimizationStatus.FAILED.value, 0),
+            "running_jobs": status_counts.get(OptimizationStatus.RUNNING.value, 0),
             "average_improvement": (
                 sum(job.results.improvement_percentage for job in completed_jobs if job.results)
                 / len(completed_jobs)
@@ -573,13 +756,10 @@ class DSPyOptimizationEngine:
         """Cleanup resources"""
         try:
             # Cancel running jobs
-            running_jobs = [
-                job for job in self.optimization_jobs.values()
-                if job.status == OptimizationStatus.RUNNING
-            ]
+            running_jobs = self._query_jobs(status=OptimizationStatus.RUNNING.value)
             
             for job in running_jobs:
-                job.status = OptimizationStatus.CANCELLED
+                self._set_job_status(job, OptimizationStatus.CANCELLED)
                 job.completed_at = datetime.utcnow()
             
             logger.info("DSPy Optimization Engine cleaned up")
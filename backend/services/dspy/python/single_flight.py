@@ -0,0 +1,71 @@
+"""
+Legal Analysis Single-Flight
+Shares one running analysis between identical concurrent requests
+"""
+
+import asyncio
+import copy
+import hashlib
+from typing import Any, Dict, Tuple
+
+def _request_key(request: Dict[str, Any]) -> Tuple:
+    """Identity of a legal analysis request; the document is hashed so keys
+    stay small however long it is"""
+    digest = hashlib.blake2b(request["document_content"].encode(), digest_size=16).digest()
+    return (
+        digest,
+        request.get("document_type"),
+        request.get("language"),
+        request.get("analysis_depth"),
+        request.get("optimization_version")
+    )
+
+class _Flight:
+    """One running analysis and the number of callers waiting on it"""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class LegalAnalysisSingleFlight:
+    """Runs identical concurrent legal analyses once.
+
+    While an analysis is running, identical requests (retries, refreshes)
+    wait on it instead of starting another. Nothing is kept once it
+    finishes. Every caller gets its own copy of the result, and the
+    analysis is cancelled when the last caller waiting on it goes away.
+    """
+
+    def __init__(self, optimization_engine):
+        self.optimization_engine = optimization_engine
+        self._inflight: Dict[Tuple, _Flight] = {}
+
+    async def analyze(self, **request: Any) -> Dict[str, Any]:
+        """Run a legal analysis, or join the identical one already running"""
+        key = _request_key(request)
+
+        flight = self._inflight.get(key)
+        if flight is None:
+            task = asyncio.create_task(self.optimization_engine.analyze_legal_document(**request))
+            flight = self._inflight[key] = _Flight(task)
+            task.add_done_callback(lambda _: self._retire(key, flight))
+
+        flight.waiters += 1
+        try:
+            # Shielded so one caller going away does not cancel the analysis
+            # for the others waiting on it
+            result = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+                self._retire(key, flight)
+
+        return copy.deepcopy(result)
+
+    def _retire(self, key: Tuple, flight: _Flight):
+        """Stop routing new requests to a finished or abandoned analysis"""
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
@@ -60,8 +60,9 @@ class PromptTemplateManager:
         try:
             templates_file = self.storage_path / "templates.json"
             if templates_file.exists():
-                with open(templates_file, 'r') as f:
-                    data = json.load(f)
+                # Read and parse in a worker thread; the file grows with
+                # every saved template
+                data = await asyncio.to_thread(self._read_json, templates_file)
                     
                 for template_data in data.get('templates', []):
                     template = PromptTemplate(**template_data)
@@ -93,14 +94,25 @@ class PromptTemplateManager:
                 "saved_at": datetime.utcnow().isoformat()
             }
             
-            with open(templates_file, 'w') as f:
-                json.dump(data, f, indent=2)
+            await asyncio.to_thread(self._write_json, templates_file, data)
             
             logger.debug("Templates saved to storage")
             
         except Exception as e:
             logger.error(f"Failed to save templates: {e}")
     
+    @staticmethod
+    def _read_json(path: Path) -> Dict[str, Any]:
+        """Load a JSON file"""
+        with open(path, 'r') as f:
+            return json.load(f)
+    
+    @staticmethod
+    def _write_json(path: Path, data: Dict[str, Any]):
+        """Write data to a JSON file"""
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+    
     async def save_optimized_module(
         self,
         module_name: str,
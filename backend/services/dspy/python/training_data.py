@@ -84,9 +84,12 @@ class TrainingDataManager:
             
             logger.info(f"Collected {len(examples)} training examples for {module_name}")
             
+            # asdict deep-copies every example; do it in a worker thread
+            entries = await asyncio.to_thread(lambda: [asdict(ex) for ex in examples])
+            
             return {
                 "id": dataset_id,
-                "entries": [asdict(ex) for ex in examples],
+                "entries": entries,
                 "timestamp": dataset.created_at,
                 "metadata": dataset.metadata
             }
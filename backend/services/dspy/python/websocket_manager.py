@@ -10,6 +10,65 @@ from typing import Dict, List, Any, Optional, Set
 from fastapi import WebSocket, WebSocketDisconnect
 from loguru import logger
 
+# Messages buffered per client before progress frames start to coalesce
+CLIENT_QUEUE_SIZE = 64
+
+# Seconds a client's queue may stay full without draining before the
+# client is dropped
+SLOW_CLIENT_TIMEOUT_SECONDS = 30
+
+class ClientQueue(asyncio.Queue):
+    """Bounded outgoing message queue for one WebSocket client.
+    
+    When the client falls behind and the queue fills up, a new progress
+    frame replaces the last queued one instead of growing the queue, since
+    only the latest progress matters. Status and completion messages evict
+    the oldest queued progress frame to make room; they are only refused
+    when nothing in the queue can give way.
+    """
+    
+    def __init__(self, maxsize: int = CLIENT_QUEUE_SIZE):
+        super().__init__(maxsize=maxsize)
+        # Loop time the queue filled up, cleared whenever the sender takes
+        # a message off it
+        self.full_since: Optional[float] = None
+    
+    def offer(self, message: Dict[str, Any]) -> bool:
+        """Queue a message without waiting; False if it had to be dropped"""
+        try:
+            self.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            pass
+        
+        if self.full_since is None:
+            self.full_since = asyncio.get_running_loop().time()
+        
+        if _is_progress_frame(message):
+            if _is_progress_frame(self._queue[-1]):
+                self._queue[-1] = message
+                return True
+            return False
+        
+        for index, queued in enumerate(self._queue):
+            if _is_progress_frame(queued):
+                del self._queue[index]
+                self._queue.append(message)
+                return True
+        return False
+    
+    def stalled(self) -> bool:
+        """Whether the queue has stayed full past SLOW_CLIENT_TIMEOUT_SECONDS"""
+        return (
+            self.full_since is not None
+            and asyncio.get_running_loop().time() - self.full_since > SLOW_CLIENT_TIMEOUT_SECONDS
+        )
+
+def _is_progress_frame(message: Dict[str, Any]) -> bool:
+    """Plain progress updates supersede each other; status and completion
+    notifications (which carry their own type in data) never do"""
+    return message.get("type") == "optimization_progress" and "type" not in message.get("data", {})
+
 class WebSocketManager:
     """Manages WebSocket connections for real-time optimization updates"""
     
@@ -23,6 +82,10 @@ class WebSocketManager:
         # General broadcast connections (for global updates)
         self.broadcast_connections: Set[WebSocket] = set()
         
+        # WebSocket -> outgoing queue and the task draining it
+        self.client_queues: Dict[WebSocket, ClientQueue] = {}
+        self.client_senders: Dict[WebSocket, asyncio.Task] = {}
+        
         logger.info("WebSocket Manager initialized")
     
     async def add_client(self, job_id: str, websocket: WebSocket):
@@ -33,11 +96,12 @@ class WebSocketManager:
             
             self.job_connections[job_id].add(websocket)
             self.connection_jobs[websocket] = job_id
+            self._open_channel(websocket)
             
             logger.info(f"Added WebSocket client for job {job_id}")
             
             # Send initial connection confirmation
-            await self._send_message(websocket, {
+            self._enqueue(websocket, {
                 "type": "connection_established",
                 "job_id": job_id,
                 "timestamp": datetime.utcnow().isoformat(),
@@ -59,6 +123,7 @@ class WebSocketManager:
             
             self.connection_jobs.pop(websocket, None)
             self.broadcast_connections.discard(websocket)
+            self._close_channel(websocket)
             
             logger.info(f"Removed WebSocket client for job {job_id}")
             
@@ -69,9 +134,10 @@ class WebSocketManager:
         """Add client for general broadcasts"""
         try:
             self.broadcast_connections.add(websocket)
+            self._open_channel(websocket)
             
             # Send welcome message
-            await self._send_message(websocket, {
+            self._enqueue(websocket, {
                 "type": "broadcast_connected",
                 "timestamp": datetime.utcnow().isoformat(),
                 "message": "Connected to DSPy optimization broadcasts"
@@ -95,22 +161,18 @@ class WebSocketManager:
                 "timestamp": datetime.utcnow().isoformat()
             }
             
-            # Send to all clients connected to this job
-            clients_to_remove = []
-            for websocket in self.job_connections[job_id].copy():
-                try:
-                    await self._send_message(websocket, message)
-                except WebSocketDisconnect:
-                    clients_to_remove.append(websocket)
-                except Exception as e:
-                    logger.warning(f"Failed to send progress to client: {e}")
-                    clients_to_remove.append(websocket)
+            # Queue for all clients connected to this job; each client's
+            # sender task drains at the pace that client can take
+            clients_to_remove = [
+                websocket for websocket in self.job_connections[job_id].copy()
+                if not self._enqueue(websocket, message)
+            ]
             
-            # Clean up disconnected clients
+            # Drop clients that have stopped keeping up
             for websocket in clients_to_remove:
-                await self.remove_client(job_id, websocket)
+                await self._drop_slow_client(websocket)
             
-            logger.debug(f"Broadcast progress for job {job_id} to {len(self.job_connections[job_id])} clients")
+            logger.debug(f"Broadcast progress for job {job_id} to {len(self.job_connections.get(job_id, ()))} clients")
             
         except Exception as e:
             logger.error(f"Failed to broadcast progress: {e}")
@@ -144,25 +206,77 @@ class WebSocketManager:
                 "timestamp": datetime.utcnow().isoformat()
             }
             
-            clients_to_remove = []
-            for websocket in self.broadcast_connections.copy():
-                try:
-                    await self._send_message(websocket, message)
-                except WebSocketDisconnect:
-                    clients_to_remove.append(websocket)
-                except Exception as e:
-                    logger.warning(f"Failed to send broadcast to client: {e}")
-                    clients_to_remove.append(websocket)
+            clients_to_remove = [
+                websocket for websocket in self.broadcast_connections.copy()
+                if not self._enqueue(websocket, message)
+            ]
             
-            # Clean up disconnected clients
+            # Drop clients that have stopped keeping up
             for websocket in clients_to_remove:
-                self.broadcast_connections.discard(websocket)
+                await self._drop_slow_client(websocket)
             
             logger.debug(f"General broadcast sent to {len(self.broadcast_connections)} clients")
             
         except Exception as e:
             logger.error(f"Failed to send general broadcast: {e}")
     
+    def _open_channel(self, websocket: WebSocket):
+        """Create the outgoing queue and sender task for a client"""
+        if websocket not in self.client_queues:
+            queue = ClientQueue()
+            self.client_queues[websocket] = queue
+            self.client_senders[websocket] = asyncio.create_task(self._sender(websocket, queue))
+    
+    def _close_channel(self, websocket: WebSocket):
+        """Discard a client's queue and stop its sender task"""
+        self.client_queues.pop(websocket, None)
+        sender = self.client_senders.pop(websocket, None)
+        if sender is not None and sender is not asyncio.current_task():
+            sender.cancel()
+    
+    def _enqueue(self, websocket: WebSocket, message: Dict[str, Any]) -> bool:
+        """Queue a message for a client; False once the client is too slow
+        or a message could not be queued for it"""
+        queue = self.client_queues.get(websocket)
+        if queue is None:
+            return False
+        return queue.offer(message) and not queue.stalled()
+    
+    async def _sender(self, websocket: WebSocket, queue: ClientQueue):
+        """Send a client's queued messages in order, one at a time"""
+        try:
+            while True:
+                message = await queue.get()
+                queue.full_since = None
+                await self._send_message(websocket, message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The connection is gone; stop tracking it
+            job_id = self.connection_jobs.get(websocket)
+            if job_id is not None:
+                await self.remove_client(job_id, websocket)
+            else:
+                self.broadcast_connections.discard(websocket)
+                self._close_channel(websocket)
+    
+    async def _drop_slow_client(self, websocket: WebSocket):
+        """Disconnect a client whose queue stayed full for too long or had
+        to refuse a message"""
+        logger.warning("Dropping WebSocket client that stopped draining messages")
+        
+        job_id = self.connection_jobs.get(websocket)
+        if job_id is not None:
+            await self.remove_client(job_id, websocket)
+        else:
+            self.broadcast_connections.discard(websocket)
+            self._close_channel(websocket)
+        
+        try:
+            await websocket.close(code=1008, reason="Client too slow")
+        except Exception:
+            pass
+    
     async def _send_message(self, websocket: WebSocket, message: Dict[str, Any]):
         """Send JSON message to WebSocket client"""
         try:
@@ -206,7 +320,7 @@ class WebSocketManager:
                 clients = list(self.job_connections[job_id])
                 for websocket in clients:
                     try:
-                        await self._send_message(websocket, {
+                        self._enqueue(websocket, {
                             "type": "auto_disconnect",
                             "job_id": job_id,
                             "message": "Job completed, disconnecting in 10 seconds",